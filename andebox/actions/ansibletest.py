@@ -8,7 +8,8 @@ from typing import List, Optional
 
 import typer
 
-from ..context import ContextType, andebox_context
+from .. import profiling
+from ..context import ContextType, FileSelection, TreeMode, andebox_context
 
 app = typer.Typer(
     name="test",
@@ -38,6 +39,29 @@ def ansible_test_cmd(
         "--galaxy-retry",
         help="Number of times to retry requirements installation on failure (default: 3)",
     ),
+    tree_mode: TreeMode = typer.Option(
+        TreeMode.COPY,
+        "--tree-mode",
+        "-t",
+        help="how files are placed in the temporary directory: copied, hard linked or reflinked (copy-on-write)",
+    ),
+    workspace: bool = typer.Option(
+        False,
+        "--workspace",
+        "-W",
+        help="use a persistent workspace instead of a temporary directory, updating only the files changed since the last run",
+    ),
+    copy_workers: int = typer.Option(
+        1,
+        "--copy-workers",
+        min=1,
+        help="number of threads copying files into the temporary directory (default: 1)",
+    ),
+    selection: FileSelection = typer.Option(
+        FileSelection.ALL,
+        "--select",
+        help="files placed in the temporary directory: all of them, or only those tracked or not ignored by git",
+    ),
     test: str = typer.Argument(..., help="test type", metavar="[sanity|units|integration]"),
     ansible_test_params: Optional[List[str]] = typer.Argument(None),
 ) -> None:
@@ -58,7 +82,15 @@ def ansible_test_cmd(
     if params[:1] == ["--"]:
         params = params[1:]
 
-    with andebox_context(ctx, make_temp_tree=True, keep=keep) as context:
+    with andebox_context(
+        ctx,
+        make_temp_tree=True,
+        keep=keep,
+        tree_mode=tree_mode,
+        workspace=workspace,
+        copy_workers=copy_workers,
+        selection=selection,
+    ) as context:
         if context.type == ContextType.COLLECTION and not skip_requirements:
             if test in ["units", "integration"]:
                 req_path = dict(
@@ -73,8 +105,9 @@ def ansible_test_cmd(
         if exclude_from_ignore:
             context.exclude_from_ignore(params)
         print(f"Running: {[context.ansible_test, test] + params}")
-        subprocess.run(
-            [context.ansible_test, test] + params,
-            cwd=context.full_dir,
-            check=True,
-        )
+        with profiling.phase("ansible-test"):
+            subprocess.run(
+                [context.ansible_test, test] + params,
+                cwd=context.full_dir,
+                check=True,
+            )
@@ -25,9 +25,21 @@ def docsite_cmd(
         help="keep temporary collection directory after execution",
     ),
     open_: bool = typer.Option(False, "--open", "-o", help="open browser pointing to main page after build"),
+    copy_workers: int = typer.Option(
+        1,
+        "--copy-workers",
+        min=1,
+        help="number of threads copying files into the temporary directory (default: 1)",
+    ),
     dest_dir: Path = typer.Option(..., "--dest-dir", "-d", help="directory where docsite is generated"),
 ) -> None:
-    with andebox_context(ctx, require_collection=True, make_temp_tree=True, keep=keep) as context:
+    with andebox_context(
+        ctx,
+        require_collection=True,
+        make_temp_tree=True,
+        keep=keep,
+        copy_workers=copy_workers,
+    ) as context:
         dest_dir.mkdir(mode=0o755, parents=True, exist_ok=True)
         if not (dest_dir / "build.sh").exists():
             subprocess.run(
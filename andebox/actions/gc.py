@@ -0,0 +1,30 @@
+# code: language=python tabSize=4
+# (C) 2026 Alexei Znamensky
+# Licensed under the MIT License. See LICENSES/MIT.txt for details.
+# SPDX-FileCopyrightText: 2026 Alexei Znamensky
+# SPDX-License-Identifier: MIT
+import shutil
+
+import typer
+
+from ..context import stale_temp_dirs
+
+app = typer.Typer(name="gc", help="removes temporary directories left behind by andebox")
+
+
+@app.callback(invoke_without_command=True)
+def gc_cmd(
+    ctx: typer.Context,
+    max_age: float = typer.Option(
+        24.0,
+        "--max-age",
+        "-a",
+        min=0,
+        help="remove temporary directories not modified for this many hours (default: 24)",
+    ),
+    dry_run: bool = typer.Option(False, "--dry-run", "-n", help="only list the directories that would be removed"),
+) -> None:
+    for temp_dir in stale_temp_dirs(max_age):
+        print(f"{'Would remove' if dry_run else 'Removing'}: {temp_dir}")
+        if not dry_run:
+            shutil.rmtree(temp_dir, ignore_errors=True)
@@ -3,48 +3,59 @@
 # Licensed under the MIT License. See LICENSES/MIT.txt for details.
 # SPDX-FileCopyrightText: 2021 Alexei Znamensky
 # SPDX-License-Identifier: MIT
+import heapq
 import re
 import sys
 from dataclasses import dataclass
-from functools import reduce, total_ordering
+from functools import lru_cache, total_ordering
 from pathlib import Path
-from typing import Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
 
 import typer
 
-from ..context import andebox_context
+from ..context import andebox_context, yaml_load
+from ..output import OutputFormat, write_records
+
+
+@lru_cache(maxsize=None)
+def _file_part(filename: str, depth: Optional[int]) -> str:
+    parts = filename.split("/")
+    return sys.intern(str(Path(*parts[:depth])))
+
+
+@lru_cache(maxsize=None)
+def _split_check(ignore_check: str) -> Tuple[str, str, Optional[str]]:
+    if ":" in ignore_check:
+        check, error_code = ignore_check.split(":")
+        return sys.intern(ignore_check), sys.intern(check), sys.intern(error_code)
+    return sys.intern(ignore_check), sys.intern(ignore_check), None
 
 
 class IgnoreFileEntry:
-    pattern = re.compile(r"^(?P<filename>\S+)\s(?P<ignore>\S+)(?:\s+#\s*(?P<comment>\S.*\S))?\s*$")
-    filter_files = None
-    filter_checks = None
-    file_parts_depth = None
+    """
+    One line of an ignore file. File names and checks repeat heavily across files and branches,
+    so they are interned, and slots keep the per-entry footprint small.
+    """
 
-    def __init__(self, filename, ignore, comment):
-        self.filename = filename
-        self._file_parts = self.filename.split("/")
+    __slots__ = ("filename", "ignore_check", "ignore", "error_code", "comment")
 
-        if ":" in ignore:
-            self.ignore, self.error_code = ignore.split(":")
-        else:
-            self.ignore, self.error_code = ignore, None
-        self.comment = comment
+    pattern = re.compile(r"^(?P<filename>\S+)\s(?P<ignore>\S+)(?:\s+#\s*(?P<comment>\S.*\S))?\s*$")
 
-    @property
-    def ignore_check(self):
-        return f"{self.ignore}:{self.error_code}" if self.error_code else self.ignore
+    def __init__(self, filename: str, ignore: str, comment: Optional[str]) -> None:
+        self.filename = sys.intern(filename)
+        self.ignore_check, self.ignore, self.error_code = _split_check(ignore)
+        self.comment = comment
 
     @property
-    def rebuilt_comment(self):
+    def rebuilt_comment(self) -> str:
         return f" # {self.comment}" if self.comment else ""
 
     @property
-    def file_parts(self):
-        if self.file_parts_depth is None:
-            return str(Path(*self._file_parts))
+    def file_parts(self) -> str:
+        return _file_part(self.filename, None)
 
-        return str(Path(*self._file_parts[: self.file_parts_depth]))
+    def file_parts_at(self, depth: Optional[int]) -> str:
+        return _file_part(self.filename, depth)
 
     def __str__(self):
         return f"<IgnoreFileEntry: {self.filename} {self.ignore_check}{self.rebuilt_comment}>"
@@ -53,24 +64,114 @@ class IgnoreFileEntry:
         return str(self)
 
     @staticmethod
-    def parse(line):
+    def parse(line: str) -> Optional["IgnoreFileEntry"]:
+        return _DEFAULT_PARSER.parse(line)
+
+
+_REGEX_METACHARS = frozenset(".^$*+?{}[]|()\\")
+
+FieldTest = Callable[[str], Any]
+
+
+def _literal_of(pattern: str) -> Optional[str]:
+    """Returns the text matched by pattern if it is a plain literal (escapes allowed), None otherwise."""
+    chars = []
+    it = iter(pattern)
+    for c in it:
+        if c == "\\":
+            escaped = next(it, None)
+            if escaped is None or escaped.isalnum():
+                return None
+            chars.append(escaped)
+        elif c in _REGEX_METACHARS:
+            return None
+        else:
+            chars.append(c)
+    return "".join(chars)
+
+
+def _compile_filter(pattern: str | re.Pattern) -> Tuple[Optional[str], FieldTest]:
+    """
+    Compiles a filter into a field test, plus a literal that every matching line must contain, when there is one.
+    Literal patterns, optionally anchored, are tested with plain string operations instead of a regex.
+    """
+    source = pattern.pattern if isinstance(pattern, re.Pattern) else pattern
+    if isinstance(source, str) and (not isinstance(pattern, re.Pattern) or pattern.flags == re.UNICODE):
+        body = source
+        anchored_start = body.startswith("^")
+        if anchored_start:
+            body = body[1:]
+        anchored_end = body.endswith("$") and not body.endswith("\\$")
+        if anchored_end:
+            body = body[:-1]
+
+        literal = _literal_of(body)
+        if literal is not None:
+            if anchored_start and anchored_end:
+                return literal, literal.__eq__
+            if anchored_start:
+                return literal, lambda field: field.startswith(literal)
+            if anchored_end:
+                return literal, lambda field: field.endswith(literal)
+            return literal, lambda field: literal in field
+
+    regex = pattern if isinstance(pattern, re.Pattern) else re.compile(pattern)
+    return None, regex.search
+
+
+class IgnoreFileParser:
+    """
+    Parses ignore file lines, keeping only the entries that pass the filters of this instance.
+    The filters are compiled once; lines missing a literal required by them are dropped before the line regex runs.
+    """
+
+    def __init__(
+        self,
+        filter_files: Optional[str | re.Pattern] = None,
+        filter_checks: Optional[str | re.Pattern] = None,
+        depth: Optional[int] = None,
+    ) -> None:
+        self.depth = depth
+        self._prefilters: List[str] = []
+        self._files_test = self._add_filter(filter_files)
+        self._checks_test = self._add_filter(filter_checks)
+
+    def _add_filter(self, pattern: Optional[str | re.Pattern]) -> Optional[FieldTest]:
+        if pattern is None:
+            return None
+        literal, test = _compile_filter(pattern)
+        if literal:
+            self._prefilters.append(literal)
+        return test
+
+    def parse(self, line: str) -> Optional[IgnoreFileEntry]:
+        for literal in self._prefilters:
+            if literal not in line:
+                return None
+
         match = IgnoreFileEntry.pattern.match(line)
         if not match:
             raise ValueError(f"Line cannot be parsed as an ignore-file entry: {line}")
 
-        ffilter = IgnoreFileEntry.filter_files
-        if ffilter is not None:
-            ffilter = ffilter if isinstance(ffilter, re.Pattern) else re.compile(ffilter)
-            if not ffilter.search(match.group("filename")):
-                return None
+        filename, ignore, comment = match.groups()
+        if self._files_test is not None and not self._files_test(filename):
+            return None
+        if self._checks_test is not None and not self._checks_test(ignore):
+            return None
 
-        ifilter = IgnoreFileEntry.filter_checks
-        if ifilter is not None:
-            ifilter = ifilter if isinstance(ifilter, re.Pattern) else re.compile(ifilter)
-            if not ifilter.search(match.group("ignore")):
-                return None
+        return IgnoreFileEntry(filename, ignore, comment)
+
+    def read(self, fh: TextIO) -> Iterator[IgnoreFileEntry]:
+        for line in fh:
+            entry = self.parse(line)
+            if entry:
+                yield entry
+
+    def file_part(self, entry: IgnoreFileEntry) -> str:
+        return entry.file_parts_at(self.depth)
 
-        return IgnoreFileEntry(match.group("filename"), match.group("ignore"), match.group("comment"))
+
+_DEFAULT_PARSER = IgnoreFileParser()
 
 
 # pragma: no cover
@@ -85,6 +186,9 @@ class ResultLine:
         self.count = self.count + 1
         return self
 
+    def as_record(self) -> Dict[str, Any]:
+        return {"count": self.count, "file": self.file_part, "check": self.ignore_check}
+
     def __lt__(self, other) -> bool:
         return self.count < other.count
 
@@ -110,37 +214,193 @@ class ResultLine:
         return "".join(r)
 
 
-# pylint: disable=consider-using-with
-def _make_fh_list_for_version(sanity_test_path, ignore_file_spec):
-    if ignore_file_spec == "-":
-        return [sys.stdin]
-    if ignore_file_spec:
-        return [open(sanity_test_path / f"ignore-{ignore_file_spec}.txt")]
+def _version_key(version: str) -> List[Tuple[int, int | str]]:
+    return [(0, int(part)) if part.isdigit() else (1, part) for part in version.split(".")]
 
-    return [p.open() for p in sanity_test_path.iterdir() if p.name.startswith("ignore-") and p.name.endswith(".txt")]
 
+def _ignore_file_paths(sanity_test_path: Path) -> Dict[str, Path]:
+    """Returns the ignore files in the directory, keyed and ordered by the version in their names."""
+    paths = {p.name[len("ignore-") : -len(".txt")]: p for p in sanity_test_path.iterdir() if p.name.startswith("ignore-") and p.name.endswith(".txt")}
+    return {version: paths[version] for version in sorted(paths, key=_version_key)}
 
-def _read_ignore_file(fh):
-    result = []
-    with fh:
-        for line in fh.readlines():
-            entry = IgnoreFileEntry.parse(line)
-            if entry:
-                result.append(entry)
-    return result
+
+def _open_ignore_files(sanity_test_path: Path, ignore_file_spec: Optional[str]) -> Iterator[TextIO]:
+    """Yields the ignore files one at a time, each one is closed before the next one is opened."""
+    if ignore_file_spec == "-":
+        yield sys.stdin
+        return
+    if ignore_file_spec:
+        paths = [sanity_test_path / f"ignore-{ignore_file_spec}.txt"]
+    else:
+        paths = list(_ignore_file_paths(sanity_test_path).values())
+
+    for path in paths:
+        with path.open() as fh:
+            yield fh
+
+
+def _retrieve_ignore_entries(parser: IgnoreFileParser, sanity_test_path: Path, ignore_file_spec: Optional[str]) -> Iterator[IgnoreFileEntry]:
+    for fh in _open_ignore_files(sanity_test_path, ignore_file_spec):
+        yield from parser.read(fh)
+
+
+def _count_entries(
+    parser: IgnoreFileParser,
+    entries: Iterable[IgnoreFileEntry],
+    suppress_files: bool,
+    suppress_checks: bool,
+) -> List[ResultLine]:
+    count_map: Dict[Tuple[str, str], ResultLine] = {}
+    for entry in entries:
+        key = _entry_key(parser, entry, suppress_files, suppress_checks)
+        result = count_map.get(key)
+        if result is None:
+            count_map[key] = ResultLine(*key)
+        else:
+            result.increase()
+    return list(count_map.values())
 
 
-def _retrieve_ignore_entries(sanity_test_path, ignore_file_spec):
-    return reduce(
-        lambda a, b: a + b,
-        [_read_ignore_file(fh) for fh in _make_fh_list_for_version(sanity_test_path, ignore_file_spec)],
+def _entry_key(parser: IgnoreFileParser, entry: IgnoreFileEntry, suppress_files: bool, suppress_checks: bool) -> Tuple[str, str]:
+    return (
+        parser.file_part(entry) if not suppress_files else "",
+        entry.ignore_check if not suppress_checks else "",
     )
 
 
-def _filter_lines(lines, num):
+@dataclass
+class IgnoreMatrix:
+    """Occurrences of each (file part, check) in each ignore file version, built reading every file once."""
+
+    versions: List[str]
+    unsupported: Set[str]
+    index: Dict[Tuple[str, str], Dict[str, int]]
+
+    @classmethod
+    def load(
+        cls,
+        parser: IgnoreFileParser,
+        sanity_test_path: Path,
+        requires_ansible: Optional[str],
+        suppress_files: bool,
+        suppress_checks: bool,
+    ) -> "IgnoreMatrix":
+        paths = _ignore_file_paths(sanity_test_path)
+        index: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for version, path in paths.items():
+            with path.open() as fh:
+                for entry in parser.read(fh):
+                    counts = index.setdefault(_entry_key(parser, entry, suppress_files, suppress_checks), {})
+                    counts[version] = counts.get(version, 0) + 1
+        versions = list(paths)
+        return cls(versions, _unsupported_versions(versions, requires_ansible), index)
+
+    def version_counts(self) -> Iterator[Tuple[str, int]]:
+        for version in self.versions:
+            yield version, sum(counts.get(version, 0) for counts in self.index.values())
+
+    def is_droppable(self, counts: Dict[str, int]) -> bool:
+        return bool(self.unsupported) and self.unsupported.issuperset(counts)
+
+    def droppable(self) -> Iterator[Tuple[Tuple[str, str], List[str]]]:
+        """Entries present only in versions the collection no longer supports."""
+        for key, counts in self.index.items():
+            if self.is_droppable(counts):
+                yield key, self._present(counts)
+
+    def partial(self) -> Iterator[Tuple[Tuple[str, str], List[str]]]:
+        """Entries missing from some of the supported versions, except for the droppable ones."""
+        for key, counts in self.index.items():
+            if self.status(counts) == "partial":
+                yield key, self._present(counts)
+
+    def _present(self, counts: Dict[str, int]) -> List[str]:
+        return [version for version in self.versions if version in counts]
+
+    def status(self, counts: Dict[str, int]) -> str:
+        if self.is_droppable(counts):
+            return "droppable"
+        if any(version not in counts and version not in self.unsupported for version in self.versions):
+            return "partial"
+        return "complete"
+
+    def fields(self) -> List[str]:
+        return ["file", "check", "status"] + self.versions
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """One record per entry, with its status and its count in each version."""
+        for (file_part, check), counts in self.index.items():
+            record: Dict[str, Any] = {"file": file_part, "check": check, "status": self.status(counts)}
+            record.update((version, counts.get(version, 0)) for version in self.versions)
+            yield record
+
+
+def _unsupported_versions(versions: List[str], requires_ansible: Optional[str]) -> Set[str]:
+    if not requires_ansible:
+        return set()
+
+    # packaging comes with ansible-core
+    from packaging.specifiers import InvalidSpecifier, SpecifierSet
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        spec = SpecifierSet(requires_ansible)
+    except InvalidSpecifier:
+        print(f"Cannot parse requires_ansible: {requires_ansible!r}, assuming all versions are supported", file=sys.stderr)
+        return set()
+
+    unsupported = set()
+    for version in versions:
+        try:
+            # ignore-X.Y.txt covers all X.Y.z releases, the version is supported if any of them may be
+            lowest, highest = Version(f"{version}.0"), Version(f"{version}.999999")
+        except InvalidVersion:
+            continue
+        if not spec.contains(lowest, prereleases=True) and not spec.contains(highest, prereleases=True):
+            unsupported.add(version)
+    return unsupported
+
+
+def _requires_ansible() -> Optional[str]:
+    runtime_yml = Path("meta") / "runtime.yml"
+    if not runtime_yml.exists():
+        return None
+    with runtime_yml.open() as fh:
+        runtime = yaml_load(fh) or {}
+    return runtime.get("requires_ansible")
+
+
+def _print_matrix(matrix: IgnoreMatrix) -> None:
+    def key_str(key: Tuple[str, str]) -> str:
+        return " ".join(k for k in key if k)
+
+    def version_str(version: str) -> str:
+        return f"{version} (unsupported)" if version in matrix.unsupported else version
+
+    print("== entries per version")
+    for version, count in matrix.version_counts():
+        print(f"{count:6}  {version_str(version)}")
+    print("== entries missing from some versions")
+    for key, present in matrix.partial():
+        print(f"{key_str(key)}  [{' '.join(present)}]")
+    print("== entries only in unsupported versions (can be removed)")
+    for key, present in matrix.droppable():
+        print(f"{key_str(key)}  [{' '.join(present)}]")
+
+
+def _filter_lines(lines: List[ResultLine], num: int) -> List[ResultLine]:
+    """
+    Returns the lines in descending order of count, ties kept in order of appearance, as a stable sort would.
+    Positive num selects the leading lines, negative num the trailing ones, zero selects all of them.
+    Only the selected lines are ordered, using a heap of size abs(num).
+    """
     if num == 0:
-        return lines
-    return lines[num:] if num < 0 else lines[:num]
+        return sorted(lines, reverse=True)
+    if num > 0:
+        return heapq.nlargest(num, lines, key=lambda line: line.count)
+    # the trailing lines of the stable descending sort are the smallest counts, the last ones to appear winning the ties
+    trailing = heapq.nsmallest(-num, enumerate(lines), key=lambda item: (item[1].count, -item[0]))
+    return [line for _, line in reversed(trailing)]
 
 
 app = typer.Typer(name="ignores", help="gathers stats on ignore*.txt file(s)")
@@ -181,17 +441,38 @@ def ignores_cmd(
         "-H",
         help="number of lines to display in the output: leading lines if positive, trailing lines if negative, all lines if zero.",
     ),
+    matrix: bool = typer.Option(
+        False,
+        "--matrix",
+        "-m",
+        help="compare all ignore files: counts per version, entries missing from some versions, and entries only in unsupported versions",
+    ),
+    output_format: OutputFormat = typer.Option(
+        OutputFormat.TEXT,
+        "--format",
+        "-F",
+        case_sensitive=False,
+        help="output format: text, or json, jsonl (one object per line) or csv for other tools",
+    ),
 ) -> None:
-    if filter_files:
-        IgnoreFileEntry.filter_files = re.compile(filter_files)
-    if filter_checks:
-        IgnoreFileEntry.filter_checks = re.compile(filter_checks)
-    if depth:
-        IgnoreFileEntry.file_parts_depth = depth
+    if matrix and spec:
+        typer.echo("andebox: error: --matrix/-m cannot be used with --spec/-s", err=True)
+        raise typer.Exit(2)
+
+    parser = IgnoreFileParser(filter_files or None, filter_checks or None, depth or None)
 
     with andebox_context(ctx) as context:
+        if matrix:
+            ignore_matrix = IgnoreMatrix.load(parser, context.sanity_test_subdir, _requires_ansible(), suppress_files, suppress_checks)
+            if output_format == OutputFormat.TEXT:
+                _print_matrix(ignore_matrix)
+            else:
+                write_records(output_format, ignore_matrix.fields(), ignore_matrix.records())
+            return
+
         try:
-            ignore_entries = _retrieve_ignore_entries(context.sanity_test_subdir, spec)
+            ignore_entries = _retrieve_ignore_entries(parser, context.sanity_test_subdir, spec)
+            result_lines = _count_entries(parser, ignore_entries, suppress_files, suppress_checks)
         except Exception as e:
             print(
                 f"Error reading ignore file {spec}: {e}",
@@ -199,12 +480,9 @@ def ignores_cmd(
             )
             raise e
 
-        count_map = {}
-        for entry in ignore_entries:
-            fp = entry.file_parts if not suppress_files else ""
-            ic = entry.ignore_check if not suppress_checks else ""
-            key = fp + "|" + ic
-            count_map[key] = count_map.get(key, ResultLine(fp, ic, 0)).increase()
-
-        lines = [str(s) for s in sorted(count_map.values(), reverse=True)]
-        print("\n".join(_filter_lines(lines, head)))
+    selected_lines = _filter_lines(result_lines, head)
+    if output_format == OutputFormat.TEXT:
+        for line in selected_lines:
+            print(line)
+    else:
+        write_records(output_format, ["count", "file", "check"], (line.as_record() for line in selected_lines))
@@ -3,15 +3,22 @@
 # Licensed under the MIT License. See LICENSES/MIT.txt for details.
 # SPDX-FileCopyrightText: 2021 Alexei Znamensky
 # SPDX-License-Identifier: MIT
+import hashlib
+import os
+import pickle
 import re
+import sys
+from contextlib import nullcontext
 from functools import partial
+from itertools import chain
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import typer
-import yaml
 
-from ..context import andebox_context
+from .. import __version__
+from ..context import andebox_cache_dir, andebox_context, file_stamp, yaml_load
+from ..output import OutputFormat, write_records
 
 PLUGIN_TYPES = (
     "connection",
@@ -33,29 +40,158 @@ def info_type_param(types, v):
         raise typer.BadParameter(f"invalid value: {v}") from e
 
 
-def _print_runtime(name, node, info_type, current_version):
+RECORD_FIELDS = ("plugin_type", "name", "info_type", "redirect", "removal_version", "warning_text", "current_version")
+
+
+def _runtime_info(node, info_type):
     def is_info_type(_type):
         return info_type is None or info_type.lower() == _type.lower()
 
     redir, tomb, depre = [node.get(x) for x in RUNTIME_TYPES]
     if redir and is_info_type("R"):
-        print(f"R {name}: redirected to {redir}")
-    elif tomb and is_info_type("T"):
-        print(f"T {name}: terminated in {tomb['removal_version']}: {tomb['warning_text']}")
-    elif depre and is_info_type("D"):
-        print(f"D {name}: deprecation in {depre['removal_version']} (current={current_version}): {depre['warning_text']}")
-
-
-def _runtime_process_plugin(plugin_routing, plugin_types, name_tests, info_type, current_version):
-    for plugin_type in plugin_types:
-        matching = [name for name in plugin_routing[plugin_type] if any(test(name) for test in name_tests)]
-        for name in matching:
-            _print_runtime(
-                f"{plugin_type} {name}",
-                plugin_routing[plugin_type][name],
-                info_type,
-                current_version,
-            )
+        return "redirect", redir
+    if tomb and is_info_type("T"):
+        return "tombstone", tomb
+    if depre and is_info_type("D"):
+        return "deprecation", depre
+    return None
+
+
+def _format_runtime(name, runtime_info, current_version):
+    kind, value = runtime_info
+    if kind == "redirect":
+        return f"R {name}: redirected to {value}"
+    if kind == "tombstone":
+        return f"T {name}: terminated in {value['removal_version']}: {value['warning_text']}"
+    return f"D {name}: deprecation in {value['removal_version']} (current={current_version}): {value['warning_text']}"
+
+
+def _runtime_record(plugin_type, name, runtime_info, current_version):
+    kind, value = runtime_info
+    record = dict.fromkeys(RECORD_FIELDS)
+    record.update(plugin_type=plugin_type, name=name, info_type=kind)
+    if kind == "redirect":
+        record["redirect"] = value
+    else:
+        record.update(removal_version=value.get("removal_version"), warning_text=value.get("warning_text"))
+        if kind == "deprecation":
+            record["current_version"] = current_version
+    return record
+
+
+def plugin_name(name: str) -> str:
+    """Plugin names may be given as paths to their files."""
+    if name.endswith(".py"):
+        name = name.split("/")[-1]
+        name = name.split(".")[0]
+    return name
+
+
+RuntimeMatch = Tuple[str, str, Dict[str, Any]]
+
+
+class RuntimeIndex:
+    """
+    Routing entries from meta/runtime.yml, indexed by plugin name and then by plugin type.
+    A pickled snapshot is kept in the andebox cache and used while runtime.yml keeps its mtime and size.
+    """
+
+    def __init__(self, plugin_routing: Optional[Dict[str, Dict[str, Any]]]) -> None:
+        self.entries: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # position of each name within its plugin type in runtime.yml, results are reported in that order
+        self.positions: Dict[str, Dict[str, int]] = {}
+        for plugin_type, plugins in (plugin_routing or {}).items():
+            plugins = plugins or {}
+            self.positions[plugin_type] = {name: pos for pos, name in enumerate(plugins)}
+            for name, node in plugins.items():
+                self.entries.setdefault(name, {})[plugin_type] = node or {}
+
+    @staticmethod
+    def snapshot_path(runtime_yml: Path) -> Path:
+        digest = hashlib.sha1(str(runtime_yml.resolve()).encode()).hexdigest()
+        return andebox_cache_dir() / "runtime" / f"{digest}.pickle"
+
+    @classmethod
+    def load(cls, runtime_yml: Path) -> "RuntimeIndex":
+        stamp = file_stamp(runtime_yml)
+        snapshot = cls.snapshot_path(runtime_yml)
+        try:
+            with snapshot.open("rb") as fh:
+                version, snapshot_stamp, index = pickle.load(fh)
+            if version == __version__ and snapshot_stamp == stamp and isinstance(index, cls):
+                return index
+        except Exception:  # pylint: disable=broad-except
+            # missing, stale or corrupt snapshots are simply rebuilt
+            pass
+
+        with runtime_yml.open() as fh:
+            runtime = yaml_load(fh) or {}
+        index = cls(runtime.get("plugin_routing"))
+
+        try:
+            snapshot.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = snapshot.with_name(f"{snapshot.name}.{os.getpid()}")
+            with tmp_path.open("wb") as fh:
+                pickle.dump((__version__, stamp, index), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(snapshot)
+        except OSError:
+            pass
+        return index
+
+    def lookup(self, plugin_types: Sequence[str], names: Iterable[str]) -> Iterator[RuntimeMatch]:
+        return self._select(plugin_types, {plugin_name(name) for name in names} & self.entries.keys())
+
+    def search(self, plugin_types: Sequence[str], patterns: Sequence[str]) -> Iterator[RuntimeMatch]:
+        regexes = [re.compile(pattern) for pattern in patterns]
+        # combined, the groups of the patterns would be renumbered, breaking their backreferences
+        if len(regexes) > 1 and all(regex.groups == 0 for regex in regexes):
+            try:
+                regexes = [re.compile("|".join(f"(?:{pattern})" for pattern in patterns))]
+            except re.error:
+                # patterns with global flags cannot be combined, test them one by one
+                pass
+        matched = {name for name in self.entries if any(regex.search(name) for regex in regexes)}
+        return self._select(plugin_types, matched)
+
+    def _select(self, plugin_types: Sequence[str], names: Iterable[str]) -> Iterator[RuntimeMatch]:
+        for plugin_type in plugin_types:
+            positions = self.positions.get(plugin_type, {})
+            for name in sorted((name for name in names if name in positions), key=positions.__getitem__):
+                yield plugin_type, name, self.entries[name][plugin_type]
+
+
+def _batch_names(batch: str) -> Iterator[str]:
+    """Reads one plugin name (or pattern) per line, skipping blank lines and comments."""
+    with nullcontext(sys.stdin) if batch == "-" else open(batch) as fh:
+        for line in fh:
+            name = line.strip()
+            if name and not name.startswith("#"):
+                yield name
+
+
+def _batch_matches(index: RuntimeIndex, plugin_types: Sequence[str], names: Iterable[str], regex: bool) -> Iterator[RuntimeMatch]:
+    """Answers each name as it is read, flushing the output so that results can be consumed while the input is produced."""
+    query = index.search if regex else index.lookup
+    for name in names:
+        yield from query(plugin_types, [name])
+        sys.stdout.flush()
+
+
+def _runtime_results(matches: Iterable[RuntimeMatch], info_type):
+    for plugin_type, name, node in matches:
+        runtime_info = _runtime_info(node, info_type)
+        if runtime_info:
+            yield plugin_type, name, runtime_info
+
+
+def _runtime_process_plugin(matches: Iterable[RuntimeMatch], info_type, current_version, output_format=OutputFormat.TEXT):
+    results = _runtime_results(matches, info_type)
+    if output_format == OutputFormat.TEXT:
+        for plugin_type, name, runtime_info in results:
+            print(_format_runtime(f"{plugin_type} {name}", runtime_info, current_version))
+    else:
+        records = (_runtime_record(plugin_type, name, runtime_info, current_version) for plugin_type, name, runtime_info in results)
+        write_records(output_format, RECORD_FIELDS, records)
 
 
 app = typer.Typer(name="runtime", help="returns information from runtime.yml")
@@ -78,30 +214,37 @@ def runtime_cmd(
         "-it",
         help=f"restrict type of response elements. Must be one of {RUNTIME_TYPES}, and it may be shortened down to one letter.",
     ),
-    plugin_names: List[str] = typer.Argument(...),
+    output_format: OutputFormat = typer.Option(
+        OutputFormat.TEXT,
+        "--format",
+        "-F",
+        case_sensitive=False,
+        help="output format: text, or json, jsonl (one object per line) or csv for other tools",
+    ),
+    batch: Optional[str] = typer.Option(
+        None,
+        "--batch",
+        "-b",
+        help="read plugin names (or patterns, with --regex) from FILE, one per line, or from stdin if FILE is '-'",
+        metavar="FILE",
+    ),
+    plugin_names: Optional[List[str]] = typer.Argument(None),
 ) -> None:
+    if not plugin_names and not batch:
+        typer.echo("andebox: error: plugin names or --batch/-b must be provided", err=True)
+        raise typer.Exit(2)
+
     parsed_info_type = partial(info_type_param, RUNTIME_TYPES)(info_type) if info_type else None
 
     with andebox_context(ctx, require_collection=True) as context:
-        with open(Path("meta") / "runtime.yml") as runtime_yml:
-            runtime = yaml.safe_load(runtime_yml)
+        index = RuntimeIndex.load(context.base_dir / "meta" / "runtime.yml")
 
         plugin_types = [plugin_type] if plugin_type else PLUGIN_TYPES
         _, _, current_version = context.read_coll_meta()  # type: ignore
 
-        def name_test(name, other):
-            if name.endswith(".py"):
-                name = name.split("/")[-1]
-                name = name.split(".")[0]
-            return name == other
-
-        test_func = re.search if regex else name_test
-        name_tests = [partial(test_func, n) for n in plugin_names]
-
-        _runtime_process_plugin(
-            runtime["plugin_routing"],
-            plugin_types,
-            name_tests,
-            parsed_info_type,
-            current_version,
-        )
+        if batch:
+            names = chain(plugin_names or [], _batch_names(batch))
+            matches = _batch_matches(index, plugin_types, names, regex)
+        else:
+            matches = index.search(plugin_types, plugin_names) if regex else index.lookup(plugin_types, plugin_names)
+        _runtime_process_plugin(matches, parsed_info_type, current_version, output_format)
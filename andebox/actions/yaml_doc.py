@@ -5,27 +5,51 @@
 # SPDX-License-Identifier: MIT
 import hashlib
 import json
+import mmap
+import os
+import pickle
 import re
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from io import StringIO
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 try:
     from ruamel.yaml import YAML
+    from ruamel.yaml import __version__ as RUAMEL_YAML_VERSION
+    from ruamel.yaml.comments import CommentedMap, CommentedSeq
     from ruamel.yaml.composer import ComposerError
+    from ruamel.yaml.scalarstring import FoldedScalarString, LiteralScalarString
 
     IMPORT_ERROR = None
 except ImportError as e:
     IMPORT_ERROR = e
+    RUAMEL_YAML_VERSION = None
 
 import typer
 
-from ..context import andebox_context
+from .. import __version__
+from ..context import andebox_cache_dir, andebox_context
 from ..exceptions import AndeboxException
 
 FIXME_TAG = "__FIXME__"
 JSON_SAMPLE_PREFIX = "JSONSAMPLE"
 
+QUOTE_RE_FRAG = r'(?:"|\'){3}'
+VAR_RE_FRAG = r"(?:[A-Z]+)"
+QUOTE_RE = re.compile(QUOTE_RE_FRAG)
+ONELINE_RE = re.compile(rf"^\s*{VAR_RE_FRAG}\s*=\s*r?{QUOTE_RE_FRAG}.*{QUOTE_RE_FRAG}$")
+FIRST_LINE_RE = re.compile(rf"^(\s*{VAR_RE_FRAG})\s*=\s*r?{QUOTE_RE_FRAG}(.*)$")
+LAST_LINE_RE = re.compile(rf"^\s*{QUOTE_RE_FRAG}")
+# matches the raw content of any file where scan_doc_blocks() can find a block, without decoding it
+DOC_BLOCK_BYTES_RE = re.compile(rb"^\s*[A-Z]+\s*=\s*r?[\"']{3}", re.MULTILINE)
+SAMPLE_ID_RE = re.compile(rf"^(\s+sample:)\s+['\"]?((ID|NI){JSON_SAMPLE_PREFIX}-[0-9a-f]{{8}})['\"]?$")
+SPLIT_LINE_RE = re.compile(r"^(\s*[-\s]\s)\S.*")
+MULTIPLE_SPACES_RE = re.compile(r"\s\s+")
+
 
 def fixme(s):
     return f"{FIXME_TAG}({s})"
@@ -65,6 +89,8 @@ OFFENDING_SPEC = [
     dict(regexp=r"\s(?:[Jj]son|[Dd]ns|[Hh]tml|[Vv]m)[\s\.,]", apply=str.upper),
 ]
 
+# every line matched by one of the rules above has a hit of one of their terms, so lines without any are not tried against each rule
+OFFENDING_PREFILTER_RE = re.compile("|".join(f"(?:{x['regexp']}{x.get('plural', '')})" for x in OFFENDING_SPEC))
 OFFENDING_SPEC = [(re.compile(f"(.*[^(])({x['regexp']})({x.get('plural', '')})([^)]?.*)"), x) for x in OFFENDING_SPEC]
 
 
@@ -74,6 +100,83 @@ class YAMLDocException(Exception):
         self.args = args
 
 
+class DocBlock(NamedTuple):
+    variable: str
+    first_line: str
+    first_line_no: int
+    content: List[str]
+    last_line_no: int
+
+
+def scan_doc_blocks(lines: Iterable[str]) -> Iterator[Union[str, DocBlock]]:
+    """
+    Scans the lines of a file once, yielding a DocBlock for each variable assigned a triple-quoted string spanning multiple lines,
+    and every other line as is, but for the quotes of the one-line triple-quoted strings, which are normalized.
+    Lines are stripped of trailing whitespace.
+    A block still open at the end of the file, for instance because its closing quotes follow some content, is yielded as plain lines.
+    """
+    block = None
+    opening_line = ""
+    for line_no, line in enumerate(lines):
+        line = line.rstrip()
+        if block is not None:
+            if not LAST_LINE_RE.match(line):
+                block.content.append(line)
+                continue
+            yield block._replace(last_line_no=line_no)
+            block = None
+        elif "'" not in line and '"' not in line:
+            yield line
+        elif ONELINE_RE.search(line):
+            yield QUOTE_RE.sub('"""', line)
+        elif match := FIRST_LINE_RE.search(line):
+            variable, first_line = match.groups()
+            block = DocBlock(variable, first_line, line_no, [], -1)
+            opening_line = line
+        else:
+            yield line
+
+    if block is not None:
+        yield opening_line
+        yield from block.content
+
+
+def is_doc_fragment(file_path: Path) -> bool:
+    return "doc_fragments" in file_path.parts
+
+
+def has_doc_blocks(file_path: Path) -> bool:
+    with open(file_path, "rb") as file:
+        try:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                return DOC_BLOCK_BYTES_RE.search(content) is not None
+        except ValueError:
+            # empty files cannot be mapped
+            return False
+
+
+def find_doc_files(plugins_dir: Path) -> List[Path]:
+    """Walks the plugins directory once, returning the Python files that may have documentation blocks, in a stable order."""
+    return [file_path for file_path in sorted(plugins_dir.rglob("*.py")) if file_path.is_file() and has_doc_blocks(file_path)]
+
+
+def write_file_atomically(file_path: Path, lines: List[str]) -> None:
+    """
+    Writes the file through a temporary file in the same directory, renamed over it, so that it is never left half-written.
+    The mode of the file is kept, and symbolic links are written through.
+    """
+    file_path = Path(os.path.realpath(file_path))
+    tmp_path = file_path.with_name(f"{file_path.name}.{os.getpid()}")
+    try:
+        with open(tmp_path, "w") as file:
+            file.writelines(lines)
+        shutil.copymode(file_path, tmp_path)
+        tmp_path.replace(file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
 def remove_quotes(s: str) -> str:
     if s[0] == s[-1] and s[0] in ('"', "'"):
         return s[1:-1].strip()
@@ -89,6 +192,27 @@ def is_json_content(sample: str, type_: str) -> bool:
     return False
 
 
+def is_json_sample(sample: Any, type_: str) -> Optional[bool]:
+    """
+    Tells whether the sample would be rendered as JSON, that is, whether is_json_content() holds for its YAML dump,
+    without dumping it. Returns None when that cannot be told from the loaded node.
+    """
+    opening = "[" if type_ == "list" else "{"
+    if isinstance(sample, (CommentedSeq, CommentedMap)):
+        # only flow style collections, or empty ones, are dumped starting with their opening bracket
+        is_seq = isinstance(sample, CommentedSeq)
+        return (opening == "[") == is_seq and (not sample or bool(sample.fa.flow_style()))
+    if isinstance(sample, (LiteralScalarString, FoldedScalarString)):
+        # block scalars are dumped after their indicator
+        return False
+    if isinstance(sample, str):
+        # strings starting with a bracket are always quoted, so the bracket comes right after the quote
+        return sample.lstrip(" ").startswith(opening)
+    if sample is None or isinstance(sample, (bool, int, float)):
+        return False
+    return None
+
+
 class AnsibleDocProcessor:
     def __init__(
         self,
@@ -97,17 +221,21 @@ class AnsibleDocProcessor:
         offenders: bool,
         fix_offenders: bool,
         dry_run: bool,
+        check: bool = False,
     ):
         self.indent = indent
         self.width = width
         self.offenders = offenders
         self.fix_offenders = fix_offenders
         self.dry_run = dry_run
+        self.check = check
         self.yaml_indents = self._calculate_indent(indent)
         self.yaml = self.make_yaml_instance()
+        self._dump_buffer = StringIO()
         self.first_line_no = 0
         self.json_samples = {}
         self.json_sample_id_count = 0
+        self.reported_offenders = 0
 
     @staticmethod
     def _calculate_indent(num: int) -> Dict[str, int]:
@@ -131,13 +259,14 @@ class AnsibleDocProcessor:
         return self.yaml.load(content)
 
     def dump_yaml(self, data: Union[Dict[str, Any], list]) -> str:
-        output = StringIO()
-        self.yaml.dump(data, output)
-        return output.getvalue()
+        self._dump_buffer.seek(0)
+        self._dump_buffer.truncate()
+        self.yaml.dump(data, self._dump_buffer)
+        return self._dump_buffer.getvalue()
 
     def fix_desc_str(self, line: str) -> str:
         line = line.strip()
-        line = re.sub(r"\s\s+", " ", line)
+        line = MULTIPLE_SPACES_RE.sub(" ", line)
         if not line[0].isupper():
             line = line[0].upper() + line[1:]
         if line.endswith(".)"):
@@ -168,8 +297,9 @@ class AnsibleDocProcessor:
         if type_ not in ("list", "dict"):
             return sample
 
-        output_sample = self.dump_yaml(sample)
-        is_json = is_json_content(output_sample, type_)
+        is_json = is_json_sample(sample, type_)
+        if is_json is None:
+            is_json = is_json_content(self.dump_yaml(sample), type_)
 
         if not is_json:
             return sample
@@ -268,11 +398,16 @@ class AnsibleDocProcessor:
             content = self.postprocess_line_length(content)
         return content
 
+    def report_offender(self, line_num: int, line: str) -> None:
+        self.reported_offenders += 1
+        if not self.check:
+            print(f"  {line_num:4}: {line}")
+
     def apply_offender_rule(self, line_num: int, line: str) -> str:
         for regexp, spec in OFFENDING_SPEC:
             if match := regexp.match(line):
                 if self.offenders and not self.fix_offenders:
-                    print(f"  {line_num:4}: {line}")
+                    self.report_offender(line_num, line)
                 prefix, term, plural, suffix = match.groups()
 
                 if func := spec.get("apply"):
@@ -285,6 +420,9 @@ class AnsibleDocProcessor:
     def process_offenders(self, content: List[str]) -> List[str]:
         result = []
         for num, line in enumerate(content):
+            if not OFFENDING_PREFILTER_RE.search(line):
+                result.append(line)
+                continue
             line_num = 2 + self.first_line_no + num
 
             def apply(line):
@@ -295,17 +433,16 @@ class AnsibleDocProcessor:
                 prev_line = fixed_line
 
             if fixed_line != line:
-                print(f"  {line_num:4}: {fixed_line}")
+                self.report_offender(line_num, fixed_line)
             result.append(fixed_line)
 
         return result
 
     def postprocess_json_samples(self, content: List[str]) -> List[str]:
         result = []
-        sample_pattern = re.compile(rf"^(\s+sample:)\s+['\"]?((ID|NI){JSON_SAMPLE_PREFIX}-[0-9a-f]{{8}})['\"]?$")
 
         for line in content:
-            match = sample_pattern.match(line)
+            match = SAMPLE_ID_RE.match(line)
             if (not match) or match.group(2) not in self.json_samples:
                 result.append(line)
                 continue
@@ -329,7 +466,6 @@ class AnsibleDocProcessor:
     def postprocess_line_length(self, content: List[str]) -> List[str]:
         """Post-process line lengths."""
         hard_limit = 160
-        LINE_RE = re.compile(r"^(\s*[-\s]\s)\S.*")
         results = []
 
         for line in content:
@@ -337,7 +473,7 @@ class AnsibleDocProcessor:
                 results.append(line)
                 continue
 
-            if match := LINE_RE.match(line):
+            if match := SPLIT_LINE_RE.match(line):
                 lead_spaces = len(match.group(1)) * " "
                 line_split = line.split(" ")
                 first_part = f"{' '.join(line_split[:-1])}"
@@ -354,60 +490,185 @@ class AnsibleDocProcessor:
 
         return results
 
-    def process_file(self, file_path: Path) -> None:  # noqa: C901
-        """Process a single file."""
-        QUOTE_RE_FRAG = r'(?:"|\'){3}'
-        VAR_RE_FRAG = r"(?:[A-Z]+)"
-        ONELINE_RE = re.compile(rf"^\s*{VAR_RE_FRAG}\s*=\s*r?{QUOTE_RE_FRAG}.*{QUOTE_RE_FRAG}$")
-        FIRST_LINE_RE = re.compile(rf"^(\s*{VAR_RE_FRAG})\s*=\s*r?{QUOTE_RE_FRAG}(.*)$")
-
-        print(f"Opening file {file_path}")
+    def process_file(self, file_path: Path) -> bool:
+        """
+        Process a single file.
+        Returns whether the file is a fixed point: the output is the same as the input and no offenders were reported.
+        The file is written only when its content changes.
+        In check mode, the file is not written, nothing is printed, and processing stops at the first block telling it is not.
+        """
+        if not self.check:
+            print(f"Opening file {file_path}")
         with open(file_path, "r") as file:
             lines = file.readlines()
+        self.reported_offenders = 0
 
         updated_lines = []
-        is_doc_frag = "doc_fragments" in file_path.parts
-        in_variable = ""
-        first_line = ""
-        quoted_content = []
+        is_doc_frag = is_doc_fragment(file_path)
         self.first_line_no = 0
+        # in check mode, the lines of input and output up to the last block checked
+        checked_lines, checked_updated_lines = 0, 0
 
-        for line_no, line in enumerate(lines):
-            line = line.rstrip()
-            if in_variable:
-                if not re.match(rf"^\s*{QUOTE_RE_FRAG}", line):
-                    quoted_content.append(line)
-                    continue
-
-                updated_lines.append(first_line)
-                processor = self.get_processor("DOCUMENTATION" if is_doc_frag else in_variable)
-                try:
-                    outbound_content = self.process_yaml(quoted_content, processor)
-                except ComposerError as e:
-                    if in_variable != "EXAMPLES" or "expected a single document" not in str(e):
-                        raise YAMLDocException(f"Error processing YAML in {file_path} at line {line_no + 1}: {e}") from e
-                    outbound_content = quoted_content
-                updated_lines.extend(self.postprocess_content(in_variable, outbound_content))
-                updated_lines.append('"""')
-
-                in_variable = ""
-                quoted_content = []
-                self.first_line_no = 0
-            else:
-                if ONELINE_RE.search(line):
-                    updated_lines.append(re.sub(QUOTE_RE_FRAG, '"""', line))
-                elif match := FIRST_LINE_RE.search(line):
-                    in_variable, yaml_first_line = match.groups()
-                    if yaml_first_line.endswith("---"):
-                        yaml_first_line = yaml_first_line[:-3]
-                    first_line = f'{in_variable} = r"""{yaml_first_line}'
-                    self.first_line_no = line_no
-                else:
-                    updated_lines.append(line)
-
-        if not self.dry_run:
-            with open(file_path, "w") as file:
-                file.writelines([f"{x}\n" for x in updated_lines])
+        for item in scan_doc_blocks(lines):
+            if isinstance(item, str):
+                updated_lines.append(item)
+                continue
+
+            yaml_first_line = item.first_line
+            if yaml_first_line.endswith("---"):
+                yaml_first_line = yaml_first_line[:-3]
+            updated_lines.append(f'{item.variable} = r"""{yaml_first_line}')
+            self.first_line_no = item.first_line_no
+
+            processor = self.get_processor("DOCUMENTATION" if is_doc_frag else item.variable)
+            try:
+                outbound_content = self.process_yaml(item.content, processor)
+            except ComposerError as e:
+                if item.variable != "EXAMPLES" or "expected a single document" not in str(e):
+                    raise YAMLDocException(f"Error processing YAML in {file_path} at line {item.last_line_no + 1}: {e}") from e
+                outbound_content = item.content
+            updated_lines.extend(self.postprocess_content(item.variable, outbound_content))
+            updated_lines.append('"""')
+            self.first_line_no = 0
+
+            if self.check:
+                if self.reported_offenders:
+                    return False
+                block_output = [f"{x}\n" for x in updated_lines[checked_updated_lines:]]
+                if block_output != lines[checked_lines : item.last_line_no + 1]:
+                    return False
+                checked_lines, checked_updated_lines = item.last_line_no + 1, len(updated_lines)
+
+        if self.dry_run:
+            # the YAML blocks are not rewritten in dry-run mode, so the output cannot tell whether the file is a fixed point
+            return False
+
+        output = [f"{x}\n" for x in updated_lines]
+        unchanged = output == lines
+        if not (self.check or unchanged):
+            write_file_atomically(file_path, output)
+        return unchanged and self.reported_offenders == 0
+
+
+class FixedPointCache:
+    """
+    Content hashes of the files known to be left unchanged by the processor, for each combination of its settings
+    and of the versions of andebox and ruamel.yaml. Those files are skipped altogether. Only the most recently seen hashes are kept.
+    """
+
+    max_hashes = 50000
+    max_settings = 10
+
+    def __init__(self, settings: Dict[str, Any], path: Optional[Path] = None) -> None:
+        self.path = path or andebox_cache_dir() / "yaml-doc.json"
+        key_settings = {k: v for k, v in settings.items() if k not in ("dry_run", "check")}
+        self.key = hashlib.sha256(json.dumps([__version__, RUAMEL_YAML_VERSION, key_settings], sort_keys=True).encode()).hexdigest()
+        try:
+            self.entries: Dict[str, Dict[str, None]] = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+        self.hashes = self.entries.pop(self.key, {})
+        self.changed = False
+
+    @staticmethod
+    def content_hash(file_path: Path) -> str:
+        # doc fragments are processed differently, so the same content elsewhere is not known to be left unchanged
+        content_hash = hashlib.sha256(file_path.read_bytes())
+        content_hash.update(b"\0doc_fragment" if is_doc_fragment(file_path) else b"\0")
+        return content_hash.hexdigest()
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self.hashes
+
+    def add(self, content_hash: str) -> None:
+        self.hashes.pop(content_hash, None)
+        self.hashes[content_hash] = None
+        self.changed = True
+
+    def save(self) -> None:
+        if not self.changed:
+            return
+        while len(self.hashes) > self.max_hashes:
+            del self.hashes[next(iter(self.hashes))]
+        self.entries[self.key] = self.hashes
+        while len(self.entries) > self.max_settings:
+            del self.entries[next(iter(self.entries))]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+            tmp_path.write_text(json.dumps(self.entries))
+            tmp_path.replace(self.path)
+        except OSError:
+            pass
+
+
+# processor of each worker process, when processing files in parallel
+_worker_processor: Optional[AnsibleDocProcessor] = None
+
+
+def _init_worker(settings: Dict[str, Any]) -> None:
+    global _worker_processor
+    _worker_processor = AnsibleDocProcessor(**settings)
+
+
+def _process_file_in_worker(file_path: Path) -> Tuple[str, bool, Optional[Exception]]:
+    """Processes one file, returning its output so that the parent can print the outputs in the order of the files."""
+    assert _worker_processor is not None
+    output = StringIO()
+    try:
+        with redirect_stdout(output):
+            fixed_point = _worker_processor.process_file(file_path)
+    except Exception as e:  # pylint: disable=broad-except
+        try:
+            pickle.dumps(e)
+        except Exception:  # pylint: disable=broad-except
+            e = YAMLDocException(f"Error processing {file_path}: {e!r}")
+        return output.getvalue(), False, e
+    return output.getvalue(), fixed_point, None
+
+
+def process_files(settings: Dict[str, Any], files: Sequence[Path], jobs: int = 1, cache: Optional[FixedPointCache] = None) -> List[Path]:
+    """
+    Processes the files with one AnsibleDocProcessor, or with one per worker process when jobs > 1.
+    Either way, the output of each file is printed as a block, in the order of the files, and processing stops at the first error.
+    Files whose content is a known fixed point in the cache are skipped.
+    In check mode, the path of each file that is not a fixed point is printed instead.
+    Returns the files that are not fixed points.
+    """
+    content_hashes = {}
+    if cache is not None:
+        content_hashes = {file_path: FixedPointCache.content_hash(file_path) for file_path in files}
+        files = [file_path for file_path in files if content_hashes[file_path] not in cache]
+    not_fixed_points = []
+
+    def record(file_path: Path, fixed_point: bool) -> None:
+        if fixed_point:
+            if cache is not None:
+                cache.add(content_hashes[file_path])
+            return
+        not_fixed_points.append(file_path)
+        if settings.get("check"):
+            print(file_path, flush=True)
+
+    try:
+        if jobs == 1 or len(files) < 2:
+            processor = AnsibleDocProcessor(**settings)
+            for file_path in files:
+                record(file_path, processor.process_file(file_path))
+            return not_fixed_points
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(files)), initializer=_init_worker, initargs=(settings,)) as executor:
+            for file_path, (output, fixed_point, error) in zip(files, executor.map(_process_file_in_worker, files)):
+                sys.stdout.write(output)
+                sys.stdout.flush()
+                if error is not None:
+                    executor.shutdown(cancel_futures=True)
+                    raise error
+                record(file_path, fixed_point)
+        return not_fixed_points
+    finally:
+        if cache is not None:
+            cache.save()
 
 
 app = typer.Typer(name="yaml-doc", help="analyze and/or reformat YAML documentation in plugins")
@@ -429,18 +690,42 @@ def yaml_doc_cmd(
         help="fix potential style-related offending constructs, implies (--offenders)",
     ),
     dry_run: bool = typer.Option(False, "--dry-run", "-n", help="do not modify files"),
+    check: bool = typer.Option(
+        False,
+        "--check",
+        help="do not modify files, list the ones that would be changed or have offenders, and fail if there is any",
+    ),
     width: int = typer.Option(120, "--width", "-w", help="width for the YAML output (default: 120)"),
     indent: int = typer.Option(2, "--indent", "-i", help="indentation for the YAML output (default: 2)"),
-    files: List[Path] = typer.Argument(..., help="Files where to search for YAML content"),
+    jobs: int = typer.Option(1, "--jobs", "-j", min=1, help="number of files processed in parallel, each in its own process"),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="process all files, instead of skipping the ones known to be left unchanged with the same settings",
+    ),
+    all_files: bool = typer.Option(
+        False,
+        "--all",
+        "-a",
+        help="process the files with documentation blocks found in the plugins directory of the collection",
+    ),
+    files: Optional[List[Path]] = typer.Argument(None, help="Files where to search for YAML content"),
 ) -> None:
-    with andebox_context(ctx):
-        processor = AnsibleDocProcessor(
+    if bool(files) == all_files:
+        typer.echo("andebox: error: either files or --all/-a must be provided", err=True)
+        raise typer.Exit(2)
+
+    with andebox_context(ctx, require_collection=all_files) as context:
+        if all_files:
+            files = find_doc_files(Path(os.path.relpath(context.base_dir / "plugins")))
+        settings = dict(
             indent=indent,
             width=width,
             offenders=offenders or fix_offenders,
             fix_offenders=fix_offenders,
-            dry_run=dry_run,
+            dry_run=dry_run and not check,
+            check=check,
         )
-
-        for file_path in files:
-            processor.process_file(file_path)
+        not_fixed_points = process_files(settings, files, jobs, None if no_cache else FixedPointCache(settings))
+    if check and not_fixed_points:
+        raise typer.Exit(1)
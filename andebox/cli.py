@@ -5,18 +5,21 @@
 # SPDX-FileCopyrightText: 2021-2022 Alexei Znamensky
 # SPDX-License-Identifier: MIT
 import importlib
-import pkgutil
 import signal
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
-import typer
+from . import profiling
 
-import andebox.actions
+# must happen before the imports below, so they get profiled as well
+profiling.enable_if_requested(sys.argv)
 
-from . import __version__
-from .exceptions import AndeboxException
+import typer  # noqa: E402
+from typer.core import TyperCommand, TyperGroup  # noqa: E402
+
+from . import __version__  # noqa: E402
+from .exceptions import AndeboxException  # noqa: E402
 
 # NoArgsIsHelpError was introduced in click 8.2.0
 try:
@@ -27,8 +30,54 @@ except ImportError:
         pass
 
 
+# action name -> (module in andebox.actions, help)
+# kept here so that listing actions does not require importing them; tests check it matches the modules
+ACTIONS = {
+    "test": ("ansibletest", "runs ansible-test in a temporary environment"),
+    "context": ("context", "returns information from running context"),
+    "docsite": ("docsite", "builds collection docsite"),
+    "gc": ("gc", "removes temporary directories left behind by andebox"),
+    "ignores": ("ignorefile", "gathers stats on ignore*.txt file(s)"),
+    "nox-test": ("noxtest", "runs ansible-test within nox, for testing in multiple ansible/python versions"),
+    "runtime": ("runtime", "returns information from runtime.yml"),
+    "tox-test": ("toxtest", "runs ansible-test within tox, for testing in multiple ansible versions"),
+    "vagrant": ("vagrant", "runs 'andebox test -- integration' within a VM managed with vagrant"),
+    "yaml-doc": ("yaml_doc", "analyze and/or reformat YAML documentation in plugins"),
+}
+
+
+def load_action(name: str) -> TyperGroup:
+    with profiling.phase(f"load action '{name}'"):
+        module = importlib.import_module(f"andebox.actions.{ACTIONS[name][0]}")
+        command = typer.main.get_group(module.app)
+    command.name = name
+    return command
+
+
+class LazyActionsGroup(TyperGroup):
+    """
+    Lists the actions from ACTIONS without importing them.
+    An action module is only imported when its command is resolved to be invoked (or completed).
+    """
+
+    def list_commands(self, ctx: typer.Context) -> List[str]:
+        return list(ACTIONS)
+
+    def get_command(self, ctx: typer.Context, cmd_name: str) -> Optional[TyperCommand]:
+        if cmd_name not in ACTIONS:
+            return None
+        return TyperCommand(cmd_name, help=ACTIONS[cmd_name][1])
+
+    def resolve_command(self, ctx: typer.Context, args: List[str]) -> Tuple[Optional[str], Optional[TyperGroup], List[str]]:
+        cmd_name, cmd, args = super().resolve_command(ctx, args)
+        if cmd_name is not None:
+            cmd = load_action(cmd_name)
+        return cmd_name, cmd, args
+
+
 app = typer.Typer(
     name="andebox",
+    cls=LazyActionsGroup,
     help=f"Ansible Developer (Tool)Box v{__version__}",
     no_args_is_help=True,
     context_settings={"help_option_names": ["-h", "--help"]},
@@ -63,31 +112,19 @@ def main(
         "-V",
         help="path to the virtual environment where andebox and ansible are installed",
     ),
+    profile_startup: bool = typer.Option(
+        False,
+        profiling.PROFILE_OPTION,
+        help=f"report import and phase timings to stderr at exit (same as setting {profiling.PROFILE_ENV_VAR}=1)",
+    ),
 ) -> None:
     ctx.ensure_object(dict)
     ctx.obj["collection"] = collection
     ctx.obj["venv"] = venv
 
 
-#
-# Adapted from:
-# https://packaging.python.org/en/latest/guides/creating-and-discovering-plugins/
-#
-def iter_namespace(ns_pkg):
-    return pkgutil.iter_modules(ns_pkg.__path__, ns_pkg.__name__ + ".")
-
-
-def load_actions():
-    for finder, name, ispkg in iter_namespace(andebox.actions):
-        module = importlib.import_module(name)
-        if hasattr(module, "app") and isinstance(module.app, typer.Typer):
-            app.add_typer(module.app)
-
-
-load_actions()
-
-
 def run():
+    profiling.mark("startup (interpreter excluded)")
     try:
         signal.signal(signal.SIGPIPE, signal.SIG_DFL)
         result = app(standalone_mode=False)
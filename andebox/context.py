@@ -3,24 +3,36 @@
 # Licensed under the MIT License. See LICENSES/MIT.txt for details.
 # SPDX-FileCopyrightText: 2023 Alexei Znamensky
 # SPDX-License-Identifier: MIT
+import errno
+import fcntl
+import hashlib
+import json
 import os
 import shutil
+import stat
 import subprocess
 import sys
 import tempfile
 import time
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import chdir as set_dir
 from contextlib import contextmanager, nullcontext
 from enum import Enum
-from pathlib import Path
-from typing import Any, Generator, Optional, Tuple, Type
+from pathlib import Path, PurePath
+from typing import Any, Callable, Generator, Iterable, Iterator, Optional, Tuple, Type
 
 import typer
 import yaml
 
+from . import profiling
 from .exceptions import AndeboxException
 
+try:
+    from yaml import CSafeLoader as YamlSafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as YamlSafeLoader  # type: ignore[assignment]
+
 toplevel_exclusion = (
     ".git",
     ".nox",
@@ -34,6 +46,13 @@ toplevel_exclusion = (
     ".ruff_cache",
 )
 
+TEMP_DIR_PREFIX = "andebox."
+TRASH_SUFFIX = ".trash"
+
+# ioctl request number for FICLONE on Linux, see ioctl_ficlone(2)
+FICLONE = 0x40049409
+LINK_UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS)
+
 
 class AndeboxUnknownContext(AndeboxException):
     pass
@@ -44,8 +63,230 @@ class ContextType(Enum):
     COLLECTION = 2
 
 
+class TreeMode(str, Enum):
+    COPY = "copy"
+    HARDLINK = "hardlink"
+    REFLINK = "reflink"
+
+
+class FileSelection(str, Enum):
+    ALL = "all"
+    GIT = "git"
+
+
+class GitSelection:
+    """Files listed by git (tracked, or untracked but not ignored), plus the directories leading to them."""
+
+    def __init__(self, files: Iterable[str]) -> None:
+        self.files = set(files)
+        self.dirs = {str(parent) for f in self.files for parent in PurePath(f).parents if parent.parts}
+
+    @classmethod
+    def from_git(cls, path: Path) -> "GitSelection":
+        try:
+            result = subprocess.run(
+                ["git", "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+                cwd=path,
+                check=True,
+                capture_output=True,
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            raise AndeboxException(f"Cannot list files with git in {path}: {e}") from e
+        return cls(f for f in result.stdout.decode().split("\0") if f)
+
+    def __contains__(self, rel_path: str) -> bool:
+        return rel_path in self.files or rel_path in self.dirs
+
+    def is_opaque(self, rel_path: str) -> bool:
+        # a directory that git lists as a file (submodule, or symlink at the top level) is copied in full
+        return rel_path in self.files
+
+
+def _hardlink(src: str, dst: str) -> None:
+    os.link(src, dst, follow_symlinks=False)
+
+
+def _reflink(src: str, dst: str) -> None:
+    with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+    shutil.copystat(src, dst)
+
+
+class LinkOrCopy:
+    """
+    Copy function for shutil.copytree() that links files instead of copying their contents.
+    Falls back to shutil.copy2() per file, and for good once the filesystem reports it cannot link at all.
+    """
+
+    def __init__(self, link_func: Callable[[str, str], None]) -> None:
+        self.link_func = link_func
+        self.supported = True
+
+    def __call__(self, src: str, dst: str) -> str:
+        if self.supported:
+            try:
+                self.link_func(src, dst)
+                return dst
+            except OSError as e:
+                if e.errno in LINK_UNSUPPORTED_ERRNOS:
+                    self.supported = False
+        return shutil.copy2(src, dst)
+
+
+def make_copy_function(tree_mode: TreeMode) -> Callable[[str, str], Any]:
+    match tree_mode:
+        case TreeMode.HARDLINK:
+            return LinkOrCopy(_hardlink)
+        case TreeMode.REFLINK:
+            return LinkOrCopy(_reflink)
+        case _:
+            return shutil.copy2
+
+
+def run_copies(copy_function: Callable[[str, str], Any], copies: Iterable[Tuple[str, str]], workers: int = 1) -> None:
+    if workers <= 1:
+        for src, dest in copies:
+            copy_function(src, dest)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(copy_function, src, dest) for src, dest in copies]
+    for future in futures:
+        future.result()
+
+
+def remove_in_background(path: Path) -> None:
+    """
+    Renames path out of the way, then removes it in a detached process, so the caller does not wait for it.
+    Trash left behind, should that process not finish, is swept by `andebox gc`.
+    """
+    trash = path.with_name(f"{path.name}{TRASH_SUFFIX}")
+    try:
+        path.rename(trash)
+        subprocess.Popen(
+            [sys.executable, "-c", "import shutil, sys; shutil.rmtree(sys.argv[1], ignore_errors=True)", str(trash)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        shutil.rmtree(trash if trash.exists() else path, ignore_errors=True)
+
+
+def stale_temp_dirs(max_age: float, temp_dir: Optional[Path] = None) -> list[Path]:
+    """
+    Temporary directories created by andebox that are trash, or that have not been modified for max_age hours.
+    """
+    temp_dir = temp_dir or Path(tempfile.gettempdir())
+    oldest = time.time() - max_age * 3600
+    result = []
+    for entry in temp_dir.glob(f"{TEMP_DIR_PREFIX}*"):
+        if entry.is_symlink() or not entry.is_dir():
+            continue
+        if entry.name.endswith(TRASH_SUFFIX) or entry.stat().st_mtime < oldest:
+            result.append(entry)
+    return sorted(result)
+
+
+def andebox_cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "andebox"
+
+
+def file_stamp(path: Path) -> Optional[list[int]]:
+    try:
+        path_stat = path.stat()
+    except OSError:
+        return None
+    return [path_stat.st_mtime_ns, path_stat.st_size]
+
+
+def yaml_load(stream: Any) -> Any:
+    """Safely loads YAML from a string or a file, using libyaml when PyYAML has been built with it."""
+    return yaml.load(stream, Loader=YamlSafeLoader)
+
+
+# galaxy.yml contents, keyed by (path, mtime_ns, size)
+_galaxy_meta: dict[Tuple[str, int, int], Tuple[str, str, str]] = {}
+
+
+def read_galaxy_meta(path: Path) -> Tuple[str, str, str]:
+    path_stat = path.stat()
+    key = (str(path), path_stat.st_mtime_ns, path_stat.st_size)
+    if key not in _galaxy_meta:
+        with path.open() as galaxy_meta:
+            meta = yaml_load(galaxy_meta)
+        _galaxy_meta[key] = (meta["namespace"], meta["name"], meta["version"])
+    return _galaxy_meta[key]
+
+
+class ContextCache:
+    """
+    On-disk cache of context detection, keyed by the directory andebox is run from.
+    An entry is only used while the files and directories it was derived from keep their mtime and size.
+    """
+
+    max_entries = 200
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path or andebox_cache_dir() / "contexts.json"
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, cur_dir: Path) -> Optional[dict[str, Any]]:
+        entry = self.entries.get(str(cur_dir))
+        if entry and all(file_stamp(Path(p)) == stamp for p, stamp in entry["stamps"].items()):
+            return entry
+        return None
+
+    def put(self, cur_dir: Path, entry: dict[str, Any]) -> None:
+        self.entries.pop(str(cur_dir), None)
+        self.entries[str(cur_dir)] = entry
+        while len(self.entries) > self.max_entries:
+            del self.entries[next(iter(self.entries))]
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}")
+            tmp_path.write_text(json.dumps(self.entries))
+            tmp_path.replace(self.path)
+        except OSError:
+            pass
+
+
+def _scan_tree(path: str, rel_dir: str, selection: Optional[GitSelection] = None) -> Iterator[Tuple[str, os.DirEntry, bool]]:
+    with os.scandir(path) as it:
+        for entry in it:
+            rel_path = f"{rel_dir}/{entry.name}"
+            if selection is not None and rel_path not in selection:
+                continue
+            is_dir = entry.is_dir(follow_symlinks=False)
+            yield rel_path, entry, is_dir
+            if is_dir:
+                yield from _scan_tree(entry.path, rel_path, None if selection is None or selection.is_opaque(rel_path) else selection)
+
+
+def _remove(path: Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _is_synced(dest: Path, src_stat: os.stat_result) -> bool:
+    try:
+        dest_stat = dest.lstat()
+    except FileNotFoundError:
+        return False
+    if stat.S_ISLNK(src_stat.st_mode):
+        return stat.S_ISLNK(dest_stat.st_mode)
+    return (dest_stat.st_mtime_ns, dest_stat.st_size) == (src_stat.st_mtime_ns, src_stat.st_size)
+
+
 class AbstractContext(ABC):
     _context_type: ContextType = None  # type: ignore
+    _marker: Path = None  # type: ignore
 
     def __init__(
         self,
@@ -55,7 +296,7 @@ class AbstractContext(ABC):
     ) -> None:
         self.base_dir = base_dir
         self.venv = venv
-        self.top_dir = Path(tempfile.mkdtemp(prefix="andebox."))
+        self.top_dir = Path(tempfile.mkdtemp(prefix=TEMP_DIR_PREFIX))
 
     @property
     def type(self) -> ContextType:
@@ -75,6 +316,20 @@ class AbstractContext(ABC):
     def full_dir(self) -> Path:
         return self.top_dir / self.sub_dir
 
+    @property
+    @abstractmethod
+    def workspace_name(self) -> str:
+        pass
+
+    @property
+    def workspace_dir(self) -> Path:
+        digest = hashlib.sha1(str(self.base_dir.resolve()).encode()).hexdigest()[:12]
+        return andebox_cache_dir() / "workspaces" / f"{self.workspace_name}-{digest}"
+
+    @property
+    def workspace_manifest(self) -> Path:
+        return self.workspace_dir.with_name(f"{self.workspace_dir.name}.json")
+
     @property
     def tests_subdir(self) -> Path:
         return Path("tests")
@@ -98,8 +353,18 @@ class AbstractContext(ABC):
     def post_sub_dir(self, top_dir: Path) -> None:
         pass
 
-    def copy_tree(self) -> None:
+    def copy_tree(
+        self,
+        tree_mode: TreeMode = TreeMode.COPY,
+        workers: int = 1,
+        selection: FileSelection = FileSelection.ALL,
+    ) -> None:
+        if workers > 1 or selection != FileSelection.ALL:
+            self.parallel_copy_tree(tree_mode, workers, selection)
+            return
+
         # copy files to tmp ansible coll dir
+        copy_function = make_copy_function(tree_mode)
         for entry in Path.cwd().iterdir():
             if any(entry.name.startswith(x) for x in toplevel_exclusion):
                 continue
@@ -109,31 +374,169 @@ class AbstractContext(ABC):
                     self.full_dir / entry.name,
                     symlinks=True,
                     ignore_dangling_symlinks=True,
+                    copy_function=copy_function,
                 )
-            else:
+            elif tree_mode == TreeMode.COPY or entry.is_symlink():
                 shutil.copy(
                     entry,
                     self.full_dir / entry.name,
                     follow_symlinks=False,
                 )
+            else:
+                copy_function(str(entry), str(self.full_dir / entry.name))
+
+    def parallel_copy_tree(self, tree_mode: TreeMode, workers: int, selection: FileSelection = FileSelection.ALL) -> None:
+        """
+        Same result as copy_tree(), but files are copied by a pool of threads while the source is being walked.
+        Directories and symlinks are created by the walking thread, so they always exist before the files within them.
+        """
+        copy_function = make_copy_function(tree_mode)
+        dirs = []
+
+        def iter_copies() -> Iterator[Tuple[str, str]]:
+            for rel_path, entry, is_dir in self.iter_source_tree(selection):
+                dest = self.full_dir / rel_path
+                if is_dir:
+                    dest.mkdir()
+                    dirs.append((entry.path, dest))
+                elif entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), dest)
+                else:
+                    yield entry.path, str(dest)
+
+        run_copies(copy_function, iter_copies(), workers)
+        for src, dest in reversed(dirs):
+            shutil.copystat(src, dest)
+
+    def iter_source_tree(self, selection: FileSelection = FileSelection.ALL) -> Iterator[Tuple[str, os.DirEntry, bool]]:
+        """
+        Yields (relative path, entry, is_dir) for everything copy_tree() copies, directories before their contents.
+        Like copy_tree(), symlinks are followed at the top level only.
+        With FileSelection.GIT, only the files git knows about (and does not ignore) are yielded,
+        and directories without any of those are not even walked.
+        """
+        git_selection = GitSelection.from_git(Path.cwd()) if selection == FileSelection.GIT else None
+        with os.scandir(Path.cwd()) as it:
+            for entry in it:
+                if any(entry.name.startswith(x) for x in toplevel_exclusion):
+                    continue
+                if git_selection is not None and entry.name not in git_selection:
+                    continue
+                is_dir = entry.is_dir()
+                yield entry.name, entry, is_dir
+                if is_dir:
+                    yield from _scan_tree(
+                        entry.path,
+                        entry.name,
+                        None if git_selection is None or git_selection.is_opaque(entry.name) else git_selection,
+                    )
+
+    def sync_tree(
+        self,
+        tree_mode: TreeMode = TreeMode.COPY,
+        workers: int = 1,
+        selection: FileSelection = FileSelection.ALL,
+    ) -> None:
+        """
+        Incremental copy_tree(): files whose mtime and size match the previous run's manifest are left alone,
+        files and directories no longer in the source are removed.
+        Every file is copied again when the tree mode or the file selection differ from the previous run's.
+        """
+        try:
+            previous = json.loads(self.workspace_manifest.read_text())
+            previous_files, previous_dirs = previous["files"], previous["dirs"]
+        except (OSError, ValueError, TypeError, KeyError):
+            previous, previous_files, previous_dirs = {}, {}, []
+        # a file synced in another mode may be, for instance, a hard link to the source where a copy is expected
+        same_settings = previous.get("tree_mode") == tree_mode.value and previous.get("selection") == selection.value
+        previous_stamps = previous_files if same_settings else {}
+
+        files = {}
+        dirs = []
+        copies = []
+        updated = 0
+        for rel_path, entry, is_dir in self.iter_source_tree(selection):
+            dest = self.full_dir / rel_path
+            if is_dir:
+                dirs.append(rel_path)
+                if not dest.is_dir() or dest.is_symlink():
+                    _remove(dest)
+                    dest.mkdir()
+                continue
 
-    @contextmanager
-    def temp_tree(self, keep: bool = False) -> Generator[Path, Any, Any]:
-        self.full_dir.mkdir(parents=True, exist_ok=True)
-        print(f"directory  = {self.full_dir}", file=sys.stderr)
-        self.copy_tree()
+            src_stat = entry.stat(follow_symlinks=False)
+            files[rel_path] = stamp = [src_stat.st_mtime_ns, src_stat.st_size]
+            if previous_stamps.get(rel_path) == stamp and _is_synced(dest, src_stat):
+                continue
 
-        self.post_sub_dir(self.top_dir)
+            _remove(dest)
+            if entry.is_symlink():
+                os.symlink(os.readlink(entry.path), dest)
+            else:
+                copies.append((entry.path, str(dest)))
+            updated += 1
+        run_copies(make_copy_function(tree_mode), copies, workers)
+
+        removed = previous_files.keys() - files.keys()
+        for rel_path in removed:
+            dest = self.full_dir / rel_path
+            if dest.is_symlink() or not dest.is_dir():
+                dest.unlink(missing_ok=True)
+        removed_dirs = set(previous_dirs) - set(dirs)
+        # deepest first, so that nested removed directories are gone before their parents
+        for rel_path in sorted(removed_dirs, key=lambda d: d.count("/"), reverse=True):
+            dest = self.full_dir / rel_path
+            if dest.is_dir() and not dest.is_symlink():
+                shutil.rmtree(dest)
+
+        manifest = dict(tree_mode=tree_mode.value, selection=selection.value, files=files, dirs=dirs)
+        self.workspace_manifest.write_text(json.dumps(manifest))
+        print(f"synced     = {updated} updated, {len(removed) + len(removed_dirs)} removed", file=sys.stderr)
 
-        yield self.full_dir
+    @contextmanager
+    def workspace_lock(self) -> Generator[None, Any, Any]:
+        self.workspace_dir.parent.mkdir(parents=True, exist_ok=True)
+        with self.workspace_dir.with_name(f"{self.workspace_dir.name}.lock").open("w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
 
-        if keep:
+    @contextmanager
+    def temp_tree(
+        self,
+        keep: bool = False,
+        tree_mode: TreeMode = TreeMode.COPY,
+        workspace: bool = False,
+        copy_workers: int = 1,
+        selection: FileSelection = FileSelection.ALL,
+    ) -> Generator[Path, Any, Any]:
+        if workspace:
+            self.top_dir.rmdir()
+            self.top_dir = self.workspace_dir
+
+        with self.workspace_lock() if workspace else nullcontext():
+            self.full_dir.mkdir(parents=True, exist_ok=True)
+            print(f"directory  = {self.full_dir}", file=sys.stderr)
+            with profiling.phase("copy tree"):
+                if workspace:
+                    self.sync_tree(tree_mode, copy_workers, selection)
+                else:
+                    self.copy_tree(tree_mode, copy_workers, selection)
+
+            self.post_sub_dir(self.top_dir)
+
+            yield self.full_dir
+
+        if workspace:
+            print(f"Keeping workspace directory: {self.full_dir}")
+        elif keep:
             print(f"Keeping temporary directory: {self.full_dir}")
         else:
             print(f"Removing temporary directory: {self.full_dir}")
-            shutil.rmtree(self.top_dir)
+            remove_in_background(self.top_dir)
 
     def copy_exclude_lines(self, src: Path, dest: Path, exclusion_filenames: list[str]) -> None:
+        # dest may be a hard link to src, so it must be replaced rather than rewritten in place
+        dest.unlink(missing_ok=True)
         with src.open("r") as src_file, dest.open("w") as dest_file:
             for line in src_file.readlines():
                 if not any(line.startswith(f) for f in exclusion_filenames):
@@ -161,6 +564,7 @@ class AbstractContext(ABC):
 
 class AnsibleCoreContext(AbstractContext):
     _context_type = ContextType.ANSIBLE_CORE
+    _marker = Path("bin") / "ansible-playbook"
 
     @property
     def ansible_test(self) -> str:
@@ -170,6 +574,10 @@ class AnsibleCoreContext(AbstractContext):
     def sub_dir(self) -> str:
         return ""
 
+    @property
+    def workspace_name(self) -> str:
+        return "ansible-core"
+
     def post_sub_dir(self, top_dir: Path) -> None:
         pass
 
@@ -184,6 +592,7 @@ class AnsibleCoreContext(AbstractContext):
 
 class CollectionContext(AbstractContext):
     _context_type = ContextType.COLLECTION
+    _marker = Path("meta") / "runtime.yml"
 
     def __init__(
         self,
@@ -204,6 +613,10 @@ class CollectionContext(AbstractContext):
         coll_dir = Path("ansible_collections") / self.namespace / self.collection
         return coll_dir
 
+    @property
+    def workspace_name(self) -> str:
+        return f"{self.namespace}.{self.collection}"
+
     def post_sub_dir(self, top_dir: Path) -> None:
         print(f"collection = {self.namespace}.{self.collection}", file=sys.stderr)
         os.putenv(
@@ -212,14 +625,8 @@ class CollectionContext(AbstractContext):
         )
 
     def read_coll_meta(self) -> tuple[str, str, str]:
-        with open("galaxy.yml") as galaxy_meta:
-            meta = yaml.safe_load(galaxy_meta)
-        self.namespace, self.name, self.version = (
-            meta["namespace"],
-            meta["name"],
-            meta["version"],
-        )
-        return meta["namespace"], meta["name"], meta["version"]
+        self.namespace, self.name, self.version = read_galaxy_meta(self.base_dir / "galaxy.yml")
+        return self.namespace, self.name, self.version
 
     def determine_collection(self, coll_arg: Optional[str]) -> tuple[str, str]:
         if coll_arg:
@@ -257,13 +664,15 @@ class CollectionContext(AbstractContext):
 ConcreteContextType = Type[AnsibleCoreContext] | Type[CollectionContext]
 ConcreteContext = AnsibleCoreContext | CollectionContext
 
+CONTEXT_CLASSES = {cls._context_type.name: cls for cls in (AnsibleCoreContext, CollectionContext)}
+
 
 def _base_dir_type(
     dir_: Path,
 ) -> ConcreteContextType:
-    if (dir_ / "bin" / "ansible-playbook").exists():
+    if (dir_ / AnsibleCoreContext._marker).exists():
         return AnsibleCoreContext
-    if (dir_ / "meta" / "runtime.yml").exists():
+    if (dir_ / CollectionContext._marker).exists():
         return CollectionContext
     raise ValueError()
 
@@ -287,9 +696,35 @@ def _determine_base_dir() -> Tuple[Path, ConcreteContextType]:
         raise AndeboxUnknownContext(f"Cannot determine context for: {cur_dir}") from e
 
 
-def create_context(collection: Optional[str] = None, venv: Optional[Path] = None) -> ConcreteContext:
+def _make_cache_entry(cur_dir: Path, base_dir: Path, basedir_type: ConcreteContextType) -> dict[str, Any]:
+    galaxy_yml = base_dir / "galaxy.yml"
+    # the mtime of the directories between cur_dir and base_dir changes if a context marker is created in them
+    inner_dirs = [d for d in [cur_dir, *cur_dir.parents] if d.is_relative_to(base_dir) and d != base_dir]
+    stamps = {str(p): file_stamp(p) for p in [base_dir / basedir_type._marker, galaxy_yml, *inner_dirs]}
+    galaxy_meta = None
+    if basedir_type is CollectionContext and stamps[str(galaxy_yml)]:
+        galaxy_meta = read_galaxy_meta(galaxy_yml)
+    return dict(base_dir=str(base_dir), type=basedir_type._context_type.name, stamps=stamps, galaxy_meta=galaxy_meta)
+
+
+def _determine_base_dir_cached(cache: ContextCache) -> Tuple[Path, ConcreteContextType]:
+    cur_dir = Path.cwd()
+    if entry := cache.get(cur_dir):
+        base_dir = Path(entry["base_dir"])
+        if entry["galaxy_meta"]:
+            galaxy_yml = str(base_dir / "galaxy.yml")
+            _galaxy_meta[(galaxy_yml, *entry["stamps"][galaxy_yml])] = tuple(entry["galaxy_meta"])
+        return base_dir, CONTEXT_CLASSES[entry["type"]]
+
     base_dir, basedir_type = _determine_base_dir()
-    return basedir_type(base_dir, collection=collection, venv=venv)
+    cache.put(cur_dir, _make_cache_entry(cur_dir, base_dir, basedir_type))
+    return base_dir, basedir_type
+
+
+def create_context(collection: Optional[str] = None, venv: Optional[Path] = None) -> ConcreteContext:
+    with profiling.phase("context detection"):
+        base_dir, basedir_type = _determine_base_dir_cached(ContextCache())
+        return basedir_type(base_dir, collection=collection, venv=venv)
 
 
 @contextmanager
@@ -298,6 +733,10 @@ def andebox_context(
     require_collection: bool = False,
     make_temp_tree: bool = False,
     keep: bool = False,
+    tree_mode: TreeMode = TreeMode.COPY,
+    workspace: bool = False,
+    copy_workers: int = 1,
+    selection: FileSelection = FileSelection.ALL,
 ):
     opts = ctx.obj or {}
     context = create_context(
@@ -308,7 +747,17 @@ def andebox_context(
         raise AndeboxException(f"Action '{ctx.info_name}' must be executed in a collection context!")
     with set_dir(context.base_dir):
         try:
-            with context.temp_tree(keep=keep) if make_temp_tree else nullcontext():
+            with (
+                context.temp_tree(
+                    keep=keep,
+                    tree_mode=tree_mode,
+                    workspace=workspace,
+                    copy_workers=copy_workers,
+                    selection=selection,
+                )
+                if make_temp_tree
+                else nullcontext()
+            ):
                 yield context
         except Exception as e:
             raise AndeboxException(f"Error in action '{ctx.info_name}': {e}") from e
@@ -0,0 +1,52 @@
+# code: language=python tabSize=4
+# (C) 2026 Alexei Znamensky
+# Licensed under the MIT License. See LICENSES/MIT.txt for details.
+# SPDX-FileCopyrightText: 2026 Alexei Znamensky
+# SPDX-License-Identifier: MIT
+import csv
+import json
+import sys
+from enum import Enum
+from typing import Any, Iterable, Mapping, Optional, Sequence, TextIO
+
+
+class OutputFormat(str, Enum):
+    TEXT = "text"
+    JSON = "json"
+    JSONL = "jsonl"
+    CSV = "csv"
+
+
+def write_records(
+    output_format: OutputFormat,
+    fields: Sequence[str],
+    records: Iterable[Mapping[str, Any]],
+    stream: Optional[TextIO] = None,
+) -> None:
+    """
+    Writes records as they are produced, without collecting them first.
+    JSON output is a single array, written element by element. CSV output has a header with the fields.
+    """
+    stream = stream or sys.stdout
+
+    if output_format == OutputFormat.JSONL:
+        for record in records:
+            stream.write(json.dumps(record))
+            stream.write("\n")
+
+    elif output_format == OutputFormat.JSON:
+        separator = "[\n"
+        for record in records:
+            stream.write(separator)
+            stream.write(json.dumps(record))
+            separator = ",\n"
+        stream.write("[]\n" if separator == "[\n" else "\n]\n")
+
+    elif output_format == OutputFormat.CSV:
+        writer = csv.DictWriter(stream, fieldnames=fields, extrasaction="ignore", lineterminator="\n")
+        writer.writeheader()
+        for record in records:
+            writer.writerow(record)
+
+    else:
+        raise ValueError(f"Records cannot be written in the format: {output_format}")
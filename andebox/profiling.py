@@ -0,0 +1,104 @@
+# code: language=python tabSize=4
+# (C) 2026 Alexei Znamensky
+# Licensed under the MIT License. See LICENSES/MIT.txt for details.
+# SPDX-FileCopyrightText: 2026 Alexei Znamensky
+# SPDX-License-Identifier: MIT
+#
+# This module is imported before anything else in andebox.cli, so it must only use the standard library.
+#
+import atexit
+import os
+import sys
+from contextlib import contextmanager
+from importlib.machinery import ExtensionFileLoader, SourceFileLoader, SourcelessFileLoader
+from time import perf_counter
+from typing import Any, Generator, List, Optional, Sequence, Tuple
+
+PROFILE_OPTION = "--profile-startup"
+PROFILE_ENV_VAR = "ANDEBOX_PROFILE_STARTUP"
+REPORT_TOP_IMPORTS = 20
+
+_origin = perf_counter()
+_enabled = False
+_phases: List[Tuple[str, float]] = []
+_imports: dict[str, float] = {}
+
+
+class _ImportTimer:
+    """
+    Meta path finder that delegates to the other finders and times the execution of each module found.
+    Times are inclusive, that is, they include the imports made by the module itself.
+    """
+
+    def find_spec(self, fullname: str, path: Optional[Sequence[str]], target: Any = None) -> Any:
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        # file loaders are created per module, so wrapping their exec_module() does not affect other modules
+        loader = spec.loader
+        if isinstance(loader, (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)):
+            exec_module = loader.exec_module
+
+            def timed_exec_module(module):
+                start = perf_counter()
+                try:
+                    exec_module(module)
+                finally:
+                    _imports[fullname] = perf_counter() - start
+
+            loader.exec_module = timed_exec_module  # type: ignore[method-assign]
+        return spec
+
+
+def is_requested(argv: Sequence[str]) -> bool:
+    return PROFILE_OPTION in argv or bool(os.environ.get(PROFILE_ENV_VAR))
+
+
+def enable() -> None:
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+    sys.meta_path.insert(0, _ImportTimer())  # type: ignore[arg-type]
+    atexit.register(report)
+
+
+def enable_if_requested(argv: Sequence[str]) -> None:
+    if is_requested(argv):
+        enable()
+
+
+def mark(name: str) -> None:
+    """Records a phase that started when the process did."""
+    if _enabled:
+        _phases.append((name, perf_counter() - _origin))
+
+
+@contextmanager
+def phase(name: str) -> Generator[None, Any, Any]:
+    if not _enabled:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, perf_counter() - start))
+
+
+def report() -> None:
+    def line(seconds: float, name: str) -> str:
+        return f"{seconds * 1000:10.1f} ms  {name}"
+
+    out = ["andebox startup profile", "  phases:"]
+    out.extend(line(seconds, name) for name, seconds in _phases)
+    out.append(f"  imports (inclusive, top {REPORT_TOP_IMPORTS}):")
+    top_imports = sorted(_imports.items(), key=lambda item: item[1], reverse=True)[:REPORT_TOP_IMPORTS]
+    out.extend(line(seconds, name) for name, seconds in top_imports)
+    print("\n".join(out), file=sys.stderr)
@@ -8,9 +8,10 @@
 import subprocess
 import sys
 from pathlib import Path
-from typing import Any, Callable, Dict, Generator, List
+from typing import Any, Callable, Dict, Generator, List, Optional
 
 import pytest
+import yaml
 from git import Repo
 
 from andebox.cli import run as cli_run
@@ -72,6 +73,33 @@ def install_andebox() -> Generator[None, None, None]:
     )
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path_factory, monkeypatch) -> None:
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path_factory.mktemp("cache")))
+
+
+@pytest.fixture
+def make_collection(tmp_path) -> Callable[..., Path]:
+    """Creates a minimal mock.coll collection, with the files given, which are relative to the collection directory."""
+
+    def _make_collection(
+        coll_dir: Optional[Path] = None,
+        version: str = "1.0.0",
+        runtime: Optional[Dict[str, Any]] = None,
+        files: Optional[Dict[str, str]] = None,
+    ) -> Path:
+        coll_dir = coll_dir or tmp_path
+        (coll_dir / "meta").mkdir(parents=True)
+        (coll_dir / "meta" / "runtime.yml").write_text(yaml.safe_dump(runtime) if runtime else "---\n")
+        (coll_dir / "galaxy.yml").write_text(yaml.safe_dump({"namespace": "mock", "name": "coll", "version": version}))
+        for rel_path, content in (files or {}).items():
+            (coll_dir / rel_path).parent.mkdir(parents=True, exist_ok=True)
+            (coll_dir / rel_path).write_text(content)
+        return coll_dir
+
+    return _make_collection
+
+
 @pytest.fixture
 def run_andebox(mocker):
 
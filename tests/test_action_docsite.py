@@ -5,8 +5,12 @@
 # SPDX-FileCopyrightText: 2025 Alexei Znamensky
 # SPDX-License-Identifier: MIT
 #
+from contextlib import chdir as set_dir
+
 import pytest
 
+import andebox.context
+
 from .utils import GIT_REPO_CG, GenericTestCase, validate_stdout, verify_patterns
 
 
@@ -39,3 +43,22 @@ def test_action_docsite(make_helper, git_repo, run_andebox, tmp_path):
         [validate_stdout, verify_patterns, validate_index_html],
     )
     test.run()
+
+
+def test_action_docsite_copy_workers(make_collection, run_andebox, mocker, tmp_path):
+    coll_dir = make_collection(tmp_path / "coll", files={"plugins/modules/mock_module.py": "# mock module\n"})
+    doc_dir = tmp_path / "docsite"
+    run_copies = mocker.spy(andebox.context, "run_copies")
+    tree_files = []
+
+    def fake_run(cmd, cwd=None, **kwargs):
+        if cwd is not None:
+            tree_files.extend(p.relative_to(cwd).as_posix() for p in cwd.rglob("*.py"))
+
+    mocker.patch("andebox.actions.docsite.subprocess.run", side_effect=fake_run)
+    with set_dir(coll_dir):
+        rc = run_andebox(GenericTestCase(id="copy-workers", input={"args": ["docsite", "--copy-workers", "4", "-d", str(doc_dir)]}, expected={}))["rc"]
+
+    assert rc == 0
+    assert run_copies.call_args.args[2] == 4
+    assert tree_files == ["plugins/modules/mock_module.py"]
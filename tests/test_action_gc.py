@@ -0,0 +1,72 @@
+# code: language=python tabSize=4
+#
+# (C) 2026 Alexei Znamensky
+# Licensed under the MIT License. See LICENSES/MIT.txt for details.
+# SPDX-FileCopyrightText: 2026 Alexei Znamensky
+# SPDX-License-Identifier: MIT
+#
+import os
+import tempfile
+import time
+
+import pytest
+
+from .utils import load_test_cases, verify_patterns, verify_return_code
+
+TEST_CASES = load_test_cases(
+    """
+- id: default
+  input:
+    args: [gc]
+  expected:
+    rc: 0
+    removed: [andebox.old, andebox.recent.trash]
+    kept: [andebox.recent, not-andebox.old]
+- id: dry-run
+  input:
+    args: [gc, --dry-run]
+  expected:
+    rc: 0
+    in_stdout: "^Would remove: .*andebox.old$"
+    kept: [andebox.old, andebox.recent, andebox.recent.trash, not-andebox.old]
+- id: max-age-zero
+  input:
+    args: [gc, --max-age, "0"]
+  expected:
+    rc: 0
+    removed: [andebox.old, andebox.recent, andebox.recent.trash]
+    kept: [not-andebox.old]
+"""
+)
+
+TEST_CASES_IDS = [item.id for item in TEST_CASES]
+
+
+@pytest.fixture
+def temp_dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+
+    def _setup(testcase):
+        old_time = time.time() - 48 * 3600
+        for name in ["andebox.old", "andebox.recent", "andebox.recent.trash", "not-andebox.old"]:
+            (tmp_path / name).mkdir()
+            (tmp_path / name / "file.txt").write_text("content\n")
+            if name.endswith(".old"):
+                os.utime(tmp_path / name, (old_time, old_time))
+        return {"basedir": tmp_path}
+
+    return _setup
+
+
+def verify_temp_dirs(testcase):
+    basedir = testcase.data["basedir"]
+    for name in testcase.expected.get("removed", []):
+        assert not (basedir / name).exists(), f"{name} should have been removed"
+    for name in testcase.expected.get("kept", []):
+        assert (basedir / name).exists(), f"{name} should have been kept"
+
+
+@pytest.mark.parametrize("testcase", TEST_CASES, ids=TEST_CASES_IDS)
+def test_action_gc(make_helper, temp_dirs, testcase, run_andebox):
+    test = make_helper(testcase, temp_dirs, run_andebox, [verify_patterns, verify_return_code, verify_temp_dirs])
+    test.run()
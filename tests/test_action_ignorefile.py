@@ -9,7 +9,7 @@ import pytest
 
 from tests.utils import validate_stdout
 
-from .utils import GIT_REPO_CG, load_test_cases, verify_patterns
+from .utils import GIT_REPO_CG, load_test_cases, verify_patterns, verify_return_code
 
 TEST_CASES = load_test_cases(
     f"""
@@ -50,8 +50,120 @@ TEST_CASES = load_test_cases(
 
 TEST_CASES_IDS = [item.id for item in TEST_CASES]
 
+LOCAL_TEST_CASES = load_test_cases(
+    r"""
+- id: local-filter-depth
+  input:
+    args: [ignores, -H0, -d, "2", -ff, '[ab]\.py$', -fc, "^validate-modules:"]
+  expected:
+    in_stdout: "^     5  plugins/modules validate-modules:doc-missing-type$"
+    stdout_line_count: 1
+- id: local-filter-literal
+  input:
+    args: [ignores, -H0, -ff, 'c\.py', -fc, pylint]
+  expected:
+    in_stdout: "^     1  plugins/modules/c.py pylint:unused-import$"
+    stdout_line_count: 1
+- id: local-matrix
+  input:
+    args: [ignores, --matrix]
+  expected:
+    in_stdout:
+      - "^     1  2.17 \\(unsupported\\)\n     2  2.18\n     3  2.19\n     2  2.20$"
+      - "^== entries missing from some versions\nplugins/modules/b.py validate-modules:doc-missing-type  \\[2.18 2.19\\]$"
+      - "^plugins/modules/a.py shebang  \\[2.20\\]$"
+      - "^== entries only in unsupported versions \\(can be removed\\)\nplugins/modules/old.py pylint:unused-import  \\[2.17\\]$"
+- id: local-matrix-csv
+  input:
+    args: [ignores, --matrix, --format, csv, -ff, old]
+  expected:
+    in_stdout:
+      - "^file,check,status,2.17,2.18,2.19,2.20\nplugins/modules/old.py,pylint:unused-import,droppable,1,0,0,0$"
+    stdout_line_count: 2
+- id: local-jsonl
+  input:
+    args: [ignores, -H1, -F, jsonl]
+  expected:
+    in_stdout:
+      - '^\{"count": 3, "file": "plugins/modules/a.py", "check": "validate-modules:doc-missing-type"\}$'
+    stdout_line_count: 1
+- id: local-json
+  input:
+    args: [ignores, -H2, -sf, -F, json]
+  expected:
+    in_stdout:
+      - '^\[\n\{"count": 5, "file": "", "check": "validate-modules:doc-missing-type"\},\n\{"count": 2, "file": "", "check": "pylint:unused-import"\}\n\]$'
+    stdout_line_count: 4
+- id: local-matrix-with-spec
+  input:
+    args: [ignores, --matrix, -s, "2.19"]
+  expected:
+    rc: 2
+    in_stderr: "--matrix/-m cannot be used with --spec/-s"
+- id: local-all
+  input:
+    args: [ignores, -H0]
+  expected:
+    in_stdout:
+      - "^     3  plugins/modules/a.py validate-modules:doc-missing-type$"
+      - "^     1  plugins/modules/c.py pylint:unused-import$"
+      - "^     1  plugins/modules/old.py pylint:unused-import$"
+    stdout_line_count: 5
+- id: local-head
+  input:
+    args: [ignores, -H2]
+  expected:
+    in_stdout:
+      - "^     3  plugins/modules/a.py validate-modules:doc-missing-type\n     2  plugins/modules/b.py validate-modules:doc-missing-type$"
+    stdout_line_count: 2
+- id: local-tail
+  input:
+    args: [ignores, -H-2]
+  expected:
+    in_stdout:
+      - "^     1  plugins/modules/c.py pylint:unused-import\n     1  plugins/modules/a.py shebang$"
+    stdout_line_count: 2
+- id: local-suppress-files
+  input:
+    args: [ignores, -sf, -s, "2.19"]
+  expected:
+    in_stdout:
+      - "^     2  validate-modules:doc-missing-type$"
+      - "^     1  pylint:unused-import$"
+    stdout_line_count: 2
+"""
+)
+
+LOCAL_TEST_CASES_IDS = [item.id for item in LOCAL_TEST_CASES]
+
+IGNORE_FILES = {
+    "ignore-2.17.txt": "plugins/modules/old.py pylint:unused-import\n",
+    "ignore-2.18.txt": "plugins/modules/a.py validate-modules:doc-missing-type\nplugins/modules/b.py validate-modules:doc-missing-type\n",
+    "ignore-2.19.txt": (
+        "plugins/modules/a.py validate-modules:doc-missing-type\n"
+        "plugins/modules/b.py validate-modules:doc-missing-type  # needs fixing\n"
+        "plugins/modules/c.py pylint:unused-import\n"
+    ),
+    "ignore-2.20.txt": "plugins/modules/a.py validate-modules:doc-missing-type\nplugins/modules/a.py shebang\n",
+}
+
 
 @pytest.mark.parametrize("testcase", TEST_CASES, ids=TEST_CASES_IDS)
 def test_action_ignores(make_helper, git_repo, testcase, run_andebox):
     test = make_helper(testcase, git_repo, run_andebox, [verify_patterns, validate_stdout])
     test.run()
+
+
+@pytest.fixture
+def local_collection(make_collection):
+    def _setup(testcase):
+        files = {f"tests/sanity/{name}": content for name, content in IGNORE_FILES.items()}
+        return {"basedir": make_collection(runtime={"requires_ansible": ">=2.18"}, files=files)}
+
+    return _setup
+
+
+@pytest.mark.parametrize("testcase", LOCAL_TEST_CASES, ids=LOCAL_TEST_CASES_IDS)
+def test_action_ignores_local(make_helper, local_collection, testcase, run_andebox):
+    test = make_helper(testcase, local_collection, run_andebox, [verify_patterns, verify_return_code, validate_stdout])
+    test.run()
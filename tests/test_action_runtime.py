@@ -6,8 +6,12 @@
 # SPDX-License-Identifier: MIT
 #
 import pytest
+import yaml
 
-from .utils import GIT_REPO_CG, load_test_cases, validate_stdout, verify_patterns
+import andebox.actions.runtime
+from andebox.actions.runtime import RuntimeIndex
+
+from .utils import GIT_REPO_CG, load_test_cases, validate_stdout, verify_patterns, verify_return_code
 
 TEST_CASES = load_test_cases(
     f"""
@@ -56,8 +60,140 @@ TEST_CASES = load_test_cases(
 
 TEST_CASES_IDS = [item.id for item in TEST_CASES]
 
+LOCAL_TEST_CASES = load_test_cases(
+    r"""
+- id: local-text
+  input:
+    args: [runtime, -pt, modules, --regex, "mod$"]
+  expected:
+    in_stdout:
+      - "^R modules old_mod: redirected to mock.coll.new_mod$"
+      - "^T modules dead_mod: terminated in 2.0.0: Gone.$"
+      - "^D modules dep_mod: deprecation in 3.0.0 \\(current=1.0.0\\): Use other.$"
+    stdout_line_count: 3
+- id: local-all-types
+  input:
+    args: [runtime, --regex, "^(old|dead)_", "plugins/lookup/dep_mod.py"]
+  expected:
+    in_stdout:
+      - "^T modules dead_mod: terminated in 2.0.0: Gone.\\nR modules old_mod: redirected to mock.coll.new_mod$"
+    stdout_line_count: 2
+- id: local-names
+  input:
+    args: [runtime, plugins/modules/dep_mod.py, old_mod, missing_mod]
+  expected:
+    in_stdout:
+      - "^D modules dep_mod: .*\\nR modules old_mod: redirected to mock.coll.new_mod$"
+    stdout_line_count: 2
+- id: local-batch
+  input:
+    args: [runtime, --batch, names.txt, dead_mod]
+  expected:
+    in_stdout:
+      - "^T modules dead_mod: .*\\nD modules dep_mod: .*\\nR modules old_mod: redirected to mock.coll.new_mod$"
+    stdout_line_count: 3
+- id: local-batch-regex-jsonl
+  input:
+    args: [runtime, -b, patterns.txt, -r, -F, jsonl]
+  expected:
+    in_stdout:
+      - '^\{"plugin_type": "modules", "name": "old_mod", '
+      - '^\{"plugin_type": "modules", "name": "dep_mod", '
+    stdout_line_count: 2
+- id: local-no-names
+  input:
+    args: [runtime]
+  expected:
+    rc: 2
+    in_stderr: "plugin names or --batch/-b must be provided"
+- id: local-jsonl
+  input:
+    args: [runtime, -pt, modules, --format, jsonl, dep_mod]
+  expected:
+    in_stdout:
+      - '^\{"plugin_type": "modules", "name": "dep_mod", "info_type": "deprecation", "redirect": null, '
+      - '"removal_version": "3.0.0", "warning_text": "Use other.", "current_version": "1.0.0"\}$'
+    stdout_line_count: 1
+- id: local-csv
+  input:
+    args: [runtime, -pt, modules, -F, csv, -it, r, --regex, "."]
+  expected:
+    in_stdout:
+      - "^plugin_type,name,info_type,redirect,removal_version,warning_text,current_version\nmodules,old_mod,redirect,mock.coll.new_mod,,,$"
+    stdout_line_count: 2
+"""
+)
+
+LOCAL_TEST_CASES_IDS = [item.id for item in LOCAL_TEST_CASES]
+
+RUNTIME_YML = {
+    "requires_ansible": ">=2.18.0",
+    "plugin_routing": {
+        "modules": {
+            "old_mod": {"redirect": "mock.coll.new_mod"},
+            "dead_mod": {"tombstone": {"removal_version": "2.0.0", "warning_text": "Gone."}},
+            "dep_mod": {"deprecation": {"removal_version": "3.0.0", "warning_text": "Use other."}},
+        },
+    },
+}
+
 
 @pytest.mark.parametrize("testcase", TEST_CASES, ids=TEST_CASES_IDS)
 def test_action_runtime(make_helper, git_repo, testcase, run_andebox):
     test = make_helper(testcase, git_repo, run_andebox, [verify_patterns, validate_stdout])
     test.run()
+
+
+@pytest.fixture
+def local_collection(make_collection):
+    def _setup(testcase):
+        files = {
+            "names.txt": "# modules to check\nplugins/modules/dep_mod.py\n\nmissing_mod\nold_mod\n",
+            "patterns.txt": "^old\n^dep\n",
+        }
+        return {"basedir": make_collection(runtime=RUNTIME_YML, files=files)}
+
+    return _setup
+
+
+@pytest.mark.parametrize("testcase", LOCAL_TEST_CASES, ids=LOCAL_TEST_CASES_IDS)
+def test_action_runtime_local(make_helper, local_collection, testcase, run_andebox):
+    test = make_helper(testcase, local_collection, run_andebox, [verify_patterns, verify_return_code, validate_stdout])
+    test.run()
+
+
+def test_runtime_index_snapshot(tmp_path, mocker):
+    runtime_yml = tmp_path / "runtime.yml"
+    runtime_yml.write_text(yaml.safe_dump(RUNTIME_YML))
+
+    index = RuntimeIndex.load(runtime_yml)
+    assert RuntimeIndex.snapshot_path(runtime_yml).exists()
+    assert [name for _, name, _ in index.search(["modules"], ["_mod$"])] == ["dead_mod", "dep_mod", "old_mod"]
+
+    yaml_load = mocker.spy(andebox.actions.runtime, "yaml_load")
+    index = RuntimeIndex.load(runtime_yml)
+    yaml_load.assert_not_called()
+    assert list(index.lookup(["modules"], ["plugins/modules/old_mod.py"])) == [("modules", "old_mod", {"redirect": "mock.coll.new_mod"})]
+
+    runtime_yml.write_text(yaml.safe_dump({"plugin_routing": {"lookup": {"new_lookup": {"redirect": "mock.coll.other"}}}}))
+    index = RuntimeIndex.load(runtime_yml)
+    yaml_load.assert_called_once()
+    assert list(index.lookup(["modules", "lookup"], ["old_mod", "new_lookup"])) == [("lookup", "new_lookup", {"redirect": "mock.coll.other"})]
+
+
+@pytest.mark.parametrize(
+    "patterns,expected",
+    [
+        (["_mod$"], ["dead_mod", "dep_mod", "old_mod"]),
+        (["^dep", "^old"], ["dep_mod", "old_mod"]),
+        # each pattern keeps its own groups
+        (["(o)ld", r"(d)ead_mo\1"], ["dead_mod", "old_mod"]),
+        # global flags are only allowed at the start of the whole regex
+        (["^dep", "(?i)^OLD"], ["dep_mod", "old_mod"]),
+    ],
+)
+def test_runtime_index_search(tmp_path, patterns, expected):
+    runtime_yml = tmp_path / "runtime.yml"
+    runtime_yml.write_text(yaml.safe_dump(RUNTIME_YML))
+    index = RuntimeIndex.load(runtime_yml)
+    assert [name for _, name, _ in index.search(["modules"], patterns)] == expected
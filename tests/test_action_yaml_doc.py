@@ -7,9 +7,14 @@
 #
 import difflib
 import importlib.util
+import os
+import time
+from contextlib import chdir as set_dir
 
 import pytest
 
+from andebox.actions.yaml_doc import AnsibleDocProcessor, DocBlock, is_json_content, is_json_sample, scan_doc_blocks
+
 from .utils import GenericTestCase, load_test_cases, verify_patterns, verify_return_code
 
 TEST_CASES_MOCK = load_test_cases(
@@ -595,6 +600,17 @@ TEST_CASES_MOCK = load_test_cases(
 TEST_CASES_MOCK_IDS = [item.id for item in TEST_CASES_MOCK]
 
 
+def module_content(tc: GenericTestCase) -> str:
+    blocks = []
+    if documentation := tc.input.get("DOCUMENTATION"):
+        blocks.append(f'DOCUMENTATION = r"""\n{documentation.strip()}\n"""')
+    if examples := tc.input.get("EXAMPLES"):
+        blocks.append(f'EXAMPLES = r"""\n{examples.strip()}\n"""')
+    if returns := tc.input.get("RETURN"):
+        blocks.append(f'RETURN = r"""\n{returns.strip()}\n"""')
+    return "\n\n".join(blocks) + "\n"
+
+
 @pytest.fixture
 def mock_plugin(tmp_path_factory):
     repo_dir = tmp_path_factory.mktemp("community_crypto")
@@ -604,15 +620,7 @@ def mock_plugin(tmp_path_factory):
     print(f"Creating {pyfile}")
 
     def _create_file(tc):
-        blocks = []
-        if documentation := tc.input.get("DOCUMENTATION"):
-            blocks.append(f'DOCUMENTATION = r"""\n{documentation.strip()}\n"""')
-        if examples := tc.input.get("EXAMPLES"):
-            blocks.append(f'EXAMPLES = r"""\n{examples.strip()}\n"""')
-        if returns := tc.input.get("RETURN"):
-            blocks.append(f'RETURN = r"""\n{returns.strip()}\n"""')
-        file_content = "\n\n".join(blocks) + "\n"
-        pyfile.write_text(file_content)
+        pyfile.write_text(module_content(tc))
         return {"pyfile": pyfile.name, "basedir": str(repo_dir)}
 
     return _create_file
@@ -686,3 +694,315 @@ def test_action_yaml_doc(make_helper, yaml_doc_executor, mock_plugin, testcase):
         [validate_yaml_doc, verify_patterns, verify_return_code],
     )
     test.run()
+
+
+@pytest.mark.parametrize(
+    "yaml_doc_args,with_error",
+    [
+        ([], False),
+        (["-n", "-o"], False),
+        (["-O", "-w", "80"], False),
+        ([], True),
+    ],
+)
+def test_action_yaml_doc_jobs(tmp_path, run_andebox, capfd, yaml_doc_args, with_error):
+    results = {}
+    for jobs in ("1", "3"):
+        repo_dir = tmp_path / f"jobs{jobs}"
+        module_dir = repo_dir / "plugins" / "modules"
+        module_dir.mkdir(parents=True)
+        files = []
+        for tc in TEST_CASES_MOCK:
+            if tc.expected.get("rc") and not with_error:
+                continue
+            pyfile = module_dir / f"{tc.id.replace('-', '_')}.py"
+            pyfile.write_text(module_content(tc))
+            files.append(pyfile)
+
+        args = ["-c", "some.collection", "yaml-doc", "-j", jobs, "--no-cache"] + yaml_doc_args + [f.relative_to(repo_dir).as_posix() for f in files]
+        capfd.readouterr()
+        with set_dir(repo_dir):
+            rc = run_andebox(GenericTestCase(id=f"jobs{jobs}", input={"args": args, "andebox_context_type": "collection"}, expected={}))["rc"]
+        out = capfd.readouterr().out
+        # with an error, files after the failing one may or may not have been processed by the other workers
+        contents = {} if with_error else {f.name: f.read_text() for f in files}
+        results[jobs] = (rc, out, contents)
+
+    assert results["1"] == results["3"]
+    assert results["1"][0] == (1 if with_error else 0)
+
+
+@pytest.fixture
+def run_yaml_doc(tmp_path, run_andebox, capfd):
+    """Runs yaml-doc in a collection at tmp_path, returning the return code and the captured output of that run only."""
+
+    def _run_yaml_doc(*yaml_doc_args):
+        args = ["-c", "some.collection", "yaml-doc"] + list(yaml_doc_args)
+        capfd.readouterr()
+        with set_dir(tmp_path):
+            rc = run_andebox(GenericTestCase(id="yaml-doc", input={"args": args, "andebox_context_type": "collection"}, expected={}))["rc"]
+        return rc, capfd.readouterr()
+
+    return _run_yaml_doc
+
+
+@pytest.fixture
+def module_and_offender(tmp_path):
+    module_dir = tmp_path / "plugins" / "modules"
+    module_dir.mkdir(parents=True)
+    pyfile = module_dir / "test_module.py"
+    pyfile.write_text(module_content(TEST_CASES_MOCK[0]))
+    offender = module_dir / "offender.py"
+    offender.write_text(module_content(next(tc for tc in TEST_CASES_MOCK if tc.id == "description-offender")))
+    return pyfile, offender
+
+
+MODULE_AND_OFFENDER = ["plugins/modules/test_module.py", "plugins/modules/offender.py"]
+
+
+def test_action_yaml_doc_cache(module_and_offender, run_yaml_doc):
+    pyfile, _ = module_and_offender
+
+    def run_cached(*yaml_doc_args):
+        rc, out = run_yaml_doc(*yaml_doc_args, *MODULE_AND_OFFENDER)
+        assert rc == 0
+        return out.out
+
+    # first run reformats the file, second run finds it unchanged, from then on it is skipped
+    assert "test_module.py" in run_cached("-o")
+    assert "test_module.py" in run_cached("-o")
+    content = pyfile.read_text()
+    out = run_cached("-o")
+    assert "test_module.py" not in out
+    assert pyfile.read_text() == content
+    # files with offenders are never skipped, so that they keep being reported
+    assert "offender.py" in out
+    assert "__FIXME__(will)" in out
+
+    # different settings or --no-cache process the file again
+    assert "test_module.py" in run_cached("-o", "-w", "80")
+    assert "test_module.py" in run_cached("-o", "--no-cache")
+    # as does any change to its content
+    pyfile.write_text(content.replace("Foo option.", "Bar option."))
+    assert "test_module.py" in run_cached("-o")
+
+
+def test_action_yaml_doc_cache_inputs(tmp_path, run_yaml_doc, monkeypatch):
+    module_dir = tmp_path / "plugins" / "modules"
+    module_dir.mkdir(parents=True)
+    pyfile = module_dir / "test_module.py"
+    pyfile.write_text(module_content(TEST_CASES_MOCK[0]))
+    run_yaml_doc("plugins/modules/test_module.py")
+    run_yaml_doc("plugins/modules/test_module.py")
+    assert "test_module.py" not in run_yaml_doc("plugins/modules/test_module.py")[1].out
+
+    # the same content in a doc fragment is processed with a different processor
+    fragment = tmp_path / "plugins" / "doc_fragments" / "test_module.py"
+    fragment.parent.mkdir()
+    fragment.write_text(pyfile.read_text())
+    assert "doc_fragments/test_module.py" in run_yaml_doc("plugins/doc_fragments/test_module.py")[1].out
+
+    # other versions of ruamel.yaml may produce a different output
+    monkeypatch.setattr("andebox.actions.yaml_doc.RUAMEL_YAML_VERSION", "0.0.1")
+    assert "test_module.py" in run_yaml_doc("plugins/modules/test_module.py")[1].out
+
+
+def test_action_yaml_doc_check(module_and_offender, run_yaml_doc):
+    pyfile, offender = module_and_offender
+    contents = (pyfile.read_text(), offender.read_text())
+
+    # only the files that would change are listed, and none of them is modified
+    rc, out = run_yaml_doc("--check", *MODULE_AND_OFFENDER)
+    assert (rc, out.out) == (1, "plugins/modules/test_module.py\nplugins/modules/offender.py\n")
+    assert (pyfile.read_text(), offender.read_text()) == contents
+
+    assert run_yaml_doc(*MODULE_AND_OFFENDER)[0] == 0
+    rc, out = run_yaml_doc("--check", *MODULE_AND_OFFENDER)
+    assert (rc, out.out) == (0, "")
+    # offenders reported, or fixed, count as changes
+    rc, out = run_yaml_doc("--check", "-o", *MODULE_AND_OFFENDER)
+    assert (rc, out.out) == (1, "plugins/modules/offender.py\n")
+    rc, out = run_yaml_doc("--check", "-O", "--no-cache", *MODULE_AND_OFFENDER)
+    assert (rc, out.out) == (1, "plugins/modules/offender.py\n")
+
+
+def test_action_yaml_doc_write_on_change(tmp_path, run_yaml_doc):
+    module_dir = tmp_path / "plugins" / "modules"
+    module_dir.mkdir(parents=True)
+    pyfile = module_dir / "test_module.py"
+    pyfile.write_text(module_content(TEST_CASES_MOCK[0]))
+    pyfile.chmod(0o750)
+    link = module_dir / "link.py"
+    link.symlink_to(pyfile.name)
+
+    # rewritten through the link, keeping its mode, without leftovers
+    original = pyfile.read_text()
+    assert run_yaml_doc("--no-cache", "plugins/modules/link.py")[0] == 0
+    assert pyfile.read_text() != original
+    assert link.is_symlink()
+    assert pyfile.stat().st_mode & 0o777 == 0o750
+    assert sorted(p.name for p in module_dir.iterdir()) == ["link.py", "test_module.py"]
+
+    # unchanged files are not written again
+    os.utime(pyfile, ns=(0, 0))
+    content = pyfile.read_text()
+    assert run_yaml_doc("--no-cache", "plugins/modules/test_module.py")[0] == 0
+    assert pyfile.read_text() == content
+    assert pyfile.stat().st_mtime_ns == 0
+
+
+def test_action_yaml_doc_all(tmp_path, run_yaml_doc):
+    module_dir = tmp_path / "plugins" / "modules"
+    module_dir.mkdir(parents=True)
+    (module_dir / "test_module.py").write_text(module_content(TEST_CASES_MOCK[0]))
+    (module_dir / "empty.py").write_text("")
+    # trailing spaces would be removed, were the file processed
+    nodoc = tmp_path / "plugins" / "module_utils" / "nodoc.py"
+    nodoc.parent.mkdir()
+    nodoc.write_text("X = 1  \n")
+
+    rc, out = run_yaml_doc("--check", "--all")
+    assert (rc, out.out) == (1, "plugins/modules/test_module.py\n")
+    rc, out = run_yaml_doc("-a")
+    assert (rc, out.out) == (0, "Opening file plugins/modules/test_module.py\n")
+    assert nodoc.read_text() == "X = 1  \n"
+
+    rc, out = run_yaml_doc("-a", "plugins/modules/test_module.py")
+    assert rc == 2
+    assert "either files or --all/-a must be provided" in out.err
+
+
+@pytest.mark.parametrize(
+    "sample",
+    [
+        "[1, 2]",
+        "- 1\n- 2",
+        '{"x": 1}',
+        "x: 1\ny: 2",
+        "[]",
+        "{}",
+        "'[1, 2]'",
+        "' {\"a\": 1}'",
+        '"{\\"a\\": 1}"',
+        "'{\n\"status\": 1\n}'",
+        "plain text",
+        "|\n  [1, 2]",
+        ">\n  {a}",
+        "5",
+        "null",
+        "\"'[1]'\"",
+        '"\\t[1]"',
+        "- [1]\n- {a: 2}",
+    ],
+)
+def test_is_json_sample(sample):
+    processor = AnsibleDocProcessor(indent=2, width=120, offenders=False, fix_offenders=False, dry_run=True)
+    node = processor.read_yaml("sample:\n  " + sample.replace("\n", "\n  "))["sample"]
+    for type_ in ("list", "dict"):
+        assert is_json_sample(node, type_) == is_json_content(processor.dump_yaml(node), type_)
+
+
+@pytest.mark.parametrize(
+    "line,expected",
+    [
+        ("Use `foo` for that.", "Use __FIXME__(`)foo__FIXME__(`) for that."),
+        ("Set it, i.e. to true.", "Set it, __FIXME__(i.e). to true."),
+        ("Some values, e.g. 1 or 2.", "Some values, __FIXME__(e.g). 1 or 2."),
+        ("Files, dirs, etc.", "Files, dirs,__FIXME__( etc)."),
+        ("Not in /etc/hosts.", "Not in /etc/hosts."),
+        ("Connect via SSH.", "Connect __FIXME__(via) SSH."),
+        ("Client versus server.", "Client __FIXME__(versus) server."),
+        ("Client vs. server.", "Client __FIXME__(vs). server."),
+        ("And vice versa.", "And vice __FIXME__(versa)."),
+        ("It won't change.", "It __FIXME__(will) not change."),
+        ("You'll see.", "You__FIXME__('ll) see."),
+        ("They've done it.", "They have done it."),
+        ("You can't do it.", "You cannot do it."),
+        ("It isn't set.", "It is not set."),
+        ("They're set.", "They are set."),
+        ("They'd set it.", "They would set it."),
+        ("Then let's see.", "Then let us see."),
+        ("Since it's been set.", "Since it has been set."),
+        ("Since it's set.", "Since it is set."),
+        ("The ids, urls and ips.", "The IDs, URLs and IPs."),
+        ("A json file, a vm, html.", "A JSON file, a VM, HTML."),
+        ("Nothing to see here.", "Nothing to see here."),
+        ("(via) at start", "(via) at start"),
+    ],
+)
+def test_process_offenders(capsys, line, expected):
+    processor = AnsibleDocProcessor(indent=2, width=120, offenders=True, fix_offenders=True, dry_run=False)
+    assert processor.process_offenders([line]) == [expected]
+    assert bool(capsys.readouterr().out) == (line != expected)
+
+
+def test_scan_doc_blocks():
+    lines = [
+        "# -*- coding: utf-8 -*-  \n",
+        "DOCUMENTATION = r'''---\n",
+        "module: foo   \n",
+        "'''\n",
+        "\n",
+        "EXAMPLES = '''short'''\n",
+        'x = "don\'t"\n',
+        '    RETURN = """\n',
+        "  foo: {}\n",
+        '    """  # end\n',
+        'UNTERMINATED = """\n',
+        "bar\n",
+    ]
+    assert list(scan_doc_blocks(lines)) == [
+        "# -*- coding: utf-8 -*-",
+        DocBlock("DOCUMENTATION", "---", 1, ["module: foo"], 3),
+        "",
+        'EXAMPLES = """short"""',
+        'x = "don\'t"',
+        DocBlock("    RETURN", "", 7, ["  foo: {}"], 9),
+        'UNTERMINATED = """',
+        "bar",
+    ]
+
+
+def test_unterminated_block(tmp_path):
+    content = 'DOCUMENTATION = r"""\nmodule: foo\n"""\n\nEXAMPLES = r"""\n- name: foo\n  foo:"""\n\n\ndef main():\n    pass\n'
+    pyfile = tmp_path / "foo.py"
+    pyfile.write_text(content)
+    processor = AnsibleDocProcessor(indent=2, width=120, offenders=False, fix_offenders=False, dry_run=False)
+    assert processor.process_file(pyfile)
+    assert pyfile.read_text() == content
+
+
+def return_heavy_module(num_values: int) -> str:
+    samples = ["[1, 2, 3]", '{"a": 1, "b": [2, 3]}', "\n    - one\n    - two", "\n    key: value", "[]", '\'["x", "y"]\'']
+    values = []
+    for n in range(num_values):
+        type_ = "list" if samples[n % len(samples)].lstrip(" \n'").startswith(("[", "-")) else "dict"
+        values.append(f"value_{n}:\n  description: Value number {n}.\n  type: {type_}\n  returned: always\n  sample: {samples[n % len(samples)]}")
+    return 'RETURN = r"""\n' + "\n".join(values) + '\n"""\n'
+
+
+@pytest.mark.slow
+def test_process_sample_benchmark(tmp_path, mocker):
+    pyfile = tmp_path / "plugins" / "modules" / "return_heavy.py"
+    pyfile.parent.mkdir(parents=True)
+    pyfile.write_text(return_heavy_module(300))
+    AnsibleDocProcessor(indent=2, width=120, offenders=False, fix_offenders=False, dry_run=False).process_file(pyfile)
+    content = pyfile.read_text()
+
+    def best_time():
+        processor = AnsibleDocProcessor(indent=2, width=120, offenders=False, fix_offenders=False, dry_run=False, check=True)
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            assert processor.process_file(pyfile)
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    classified = best_time()
+    # every sample classified by dumping it, as before is_json_sample() existed
+    mocker.patch("andebox.actions.yaml_doc.is_json_sample", return_value=None)
+    dumped = best_time()
+
+    assert pyfile.read_text() == content
+    print(f"RETURN-heavy module: {dumped * 1000:.1f}ms per file dumping samples, {classified * 1000:.1f}ms classifying them")
+    assert classified < dumped
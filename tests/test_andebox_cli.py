@@ -0,0 +1,37 @@
+# code: language=python tabSize=4
+#
+# (C) 2026 Alexei Znamensky
+# Licensed under the MIT License. See LICENSES/MIT.txt for details.
+# SPDX-FileCopyrightText: 2026 Alexei Znamensky
+# SPDX-License-Identifier: MIT
+#
+import importlib
+import pkgutil
+import subprocess
+import sys
+
+import pytest
+import typer
+
+import andebox.actions
+from andebox.cli import ACTIONS
+
+
+def test_actions_manifest():
+    modules = {}
+    for module_info in pkgutil.iter_modules(andebox.actions.__path__):
+        module = importlib.import_module(f"andebox.actions.{module_info.name}")
+        if isinstance(getattr(module, "app", None), typer.Typer):
+            modules[module.app.info.name] = (module_info.name, module.app.info.help)
+
+    assert modules == ACTIONS
+
+
+@pytest.mark.parametrize("args", [["--help"], ["context"]])
+def test_lazy_imports(args, make_collection):
+    coll_dir = make_collection()
+    script = f"import sys; sys.argv = ['andebox'] + {args!r}; from andebox.cli import run; run(); print(sorted(sys.modules))"
+    result = subprocess.run([sys.executable, "-c", script], cwd=coll_dir, capture_output=True, text=True, check=True)
+    loaded = result.stdout.splitlines()[-1]
+    for heavy in ("ruamel.yaml", "vagrant", "fabric", "nox", "andebox.actions.yaml_doc"):
+        assert f"'{heavy}'" not in loaded
@@ -5,15 +5,35 @@
 # SPDX-FileCopyrightText: 2024 Alexei Znamensky
 # SPDX-License-Identifier: MIT
 #
+import shutil
+import time
 from contextlib import chdir as set_dir
 
 import pytest
+import yaml
+from git import Repo
 
-from andebox.context import AndeboxUnknownContext, ContextType, create_context
+import andebox.context
+from andebox.context import AndeboxUnknownContext, ContextType, FileSelection, TreeMode, YamlSafeLoader, create_context, yaml_load
 
 from .utils import GIT_REPO_AC, GIT_REPO_CG, GenericTestCase
 
 
+@pytest.fixture
+def mock_collection(tmp_path, make_collection):
+    coll_dir = make_collection(
+        tmp_path / "mock_collection",
+        version="1.2.3",
+        runtime={"requires_ansible": ">=2.16.0"},
+        files={
+            "plugins/modules/mock_module.py": "# mock module\n",
+            "tests/sanity/ignore-2.19.txt": "plugins/modules/mock_module.py validate-modules:missing-gplv3-license\nplugins/modules/other.py shebang\n",
+        },
+    )
+    (coll_dir / ".git").mkdir()
+    return coll_dir
+
+
 @pytest.fixture
 def repo_dir(git_repo):
     def _repo_dir(repo: str) -> str:
@@ -43,3 +63,198 @@ def test_invalid_dir(tmp_path):
     with set_dir(repo_dir):
         with pytest.raises(AndeboxUnknownContext):
             create_context()
+
+
+@pytest.mark.parametrize("tree_mode", list(TreeMode))
+def test_temp_tree_modes(mock_collection, tree_mode):
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(tree_mode=tree_mode) as full_dir:
+            assert str(full_dir).endswith("ansible_collections/mock/coll")
+            assert (full_dir / "plugins" / "modules" / "mock_module.py").read_text() == "# mock module\n"
+            assert (full_dir / "galaxy.yml").exists()
+            assert not (full_dir / ".git").exists()
+        assert not context.top_dir.exists()
+
+
+def test_temp_tree_hardlink(mock_collection):
+    src_file = mock_collection / "plugins" / "modules" / "mock_module.py"
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(tree_mode=TreeMode.HARDLINK) as full_dir:
+            dest_file = full_dir / "plugins" / "modules" / "mock_module.py"
+            if dest_file.stat().st_dev == src_file.stat().st_dev:
+                assert dest_file.stat().st_ino == src_file.stat().st_ino
+
+
+def test_exclude_from_ignore_hardlink(mock_collection):
+    ignore_file = mock_collection / "tests" / "sanity" / "ignore-2.19.txt"
+    original = ignore_file.read_text()
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(tree_mode=TreeMode.HARDLINK) as full_dir:
+            context.exclude_from_ignore(["plugins/modules/mock_module.py"])
+            assert (full_dir / "tests" / "sanity" / "ignore-2.19.txt").read_text() == "plugins/modules/other.py shebang\n"
+    assert ignore_file.read_text() == original
+
+
+def test_temp_tree_workspace(mock_collection, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    modules_dir = mock_collection / "plugins" / "modules"
+    (modules_dir / "unchanged.py").write_text("# unchanged\n")
+
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(workspace=True) as full_dir:
+            assert full_dir.is_relative_to(tmp_path / "cache" / "andebox" / "workspaces")
+            unchanged_ino = (full_dir / "plugins" / "modules" / "unchanged.py").stat().st_ino
+        assert full_dir.exists()
+
+        (modules_dir / "mock_module.py").write_text("# changed mock module\n")
+        (modules_dir / "new_module.py").write_text("# new module\n")
+        (mock_collection / "README.md").write_text("readme\n")
+
+        context = create_context()
+        with context.temp_tree(workspace=True) as full_dir2:
+            assert full_dir2 == full_dir
+            dest_modules = full_dir / "plugins" / "modules"
+            assert (dest_modules / "mock_module.py").read_text() == "# changed mock module\n"
+            assert (dest_modules / "new_module.py").read_text() == "# new module\n"
+            assert (dest_modules / "unchanged.py").stat().st_ino == unchanged_ino
+            assert (full_dir / "README.md").exists()
+
+        (mock_collection / "README.md").unlink()
+        shutil.rmtree(mock_collection / "tests" / "sanity")
+        context = create_context()
+        with context.temp_tree(workspace=True) as full_dir3:
+            assert not (full_dir3 / "README.md").exists()
+            assert not (full_dir3 / "tests" / "sanity").exists()
+            assert (full_dir3 / "tests").is_dir()
+
+
+def test_temp_tree_workspace_mode_change(mock_collection, tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    src_file = mock_collection / "plugins" / "modules" / "mock_module.py"
+
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(workspace=True, tree_mode=TreeMode.HARDLINK) as full_dir:
+            dest_file = full_dir / "plugins" / "modules" / "mock_module.py"
+            if dest_file.stat().st_ino != src_file.stat().st_ino:
+                pytest.skip("hard links are not supported between the source and the workspace")
+
+        # files hard-linked by the previous run are copied, so that writes in the tree do not reach the source
+        context = create_context()
+        with context.temp_tree(workspace=True, tree_mode=TreeMode.COPY) as full_dir:
+            assert dest_file.stat().st_ino != src_file.stat().st_ino
+            dest_file.write_text("# changed in the tree\n")
+        assert src_file.read_text() == "# mock module\n"
+
+
+@pytest.mark.parametrize("tree_mode", list(TreeMode))
+def test_temp_tree_ansible_test_paths(mock_collection, tree_mode):
+    unversioned = pytest.importorskip("ansible_test._internal.provider.source.unversioned")
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(tree_mode=tree_mode) as full_dir:
+            # ansible-test finds the files to test with os.walk(), which does not follow symlinked directories
+            paths = unversioned.UnversionedSource(str(full_dir)).get_paths(str(full_dir))
+    assert "plugins/modules/mock_module.py" in paths
+    assert "meta/runtime.yml" in paths
+    assert "tests/sanity/ignore-2.19.txt" in paths
+
+
+@pytest.mark.parametrize("tree_mode", [TreeMode.COPY, TreeMode.HARDLINK])
+def test_temp_tree_copy_workers(mock_collection, tree_mode):
+    (mock_collection / "plugins" / "modules" / "link_module.py").symlink_to("mock_module.py")
+    (mock_collection / "plugins" / "modules" / "dangling.py").symlink_to("does_not_exist.py")
+    (mock_collection / "docs").mkdir()
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(tree_mode=tree_mode, copy_workers=4) as full_dir:
+            modules_dir = full_dir / "plugins" / "modules"
+            assert (modules_dir / "mock_module.py").read_text() == "# mock module\n"
+            assert (modules_dir / "link_module.py").is_symlink()
+            assert (modules_dir / "dangling.py").is_symlink()
+            assert (full_dir / "docs").is_dir()
+            assert (full_dir / "tests" / "sanity" / "ignore-2.19.txt").exists()
+            assert not (full_dir / ".git").exists()
+
+
+@pytest.mark.parametrize("copy_workers", [1, 4])
+def test_temp_tree_select_git(mock_collection, copy_workers):
+    shutil.rmtree(mock_collection / ".git")
+    (mock_collection / ".gitignore").write_text("*.log\n__pycache__/\n/build/\n")
+    (mock_collection / "plugins" / "modules" / "__pycache__").mkdir()
+    (mock_collection / "plugins" / "modules" / "__pycache__" / "mock_module.pyc").write_bytes(b"\0")
+    (mock_collection / "plugins" / "modules" / "debug.log").write_text("junk\n")
+    (mock_collection / "build").mkdir()
+    (mock_collection / "build" / "artifact.tar.gz").write_bytes(b"\0")
+    (mock_collection / "untracked.txt").write_text("not ignored\n")
+    repo = Repo.init(mock_collection)
+    repo.index.add(["galaxy.yml", "meta/runtime.yml", "plugins/modules/mock_module.py", "tests/sanity/ignore-2.19.txt", ".gitignore"])
+
+    with set_dir(mock_collection):
+        context = create_context()
+        with context.temp_tree(copy_workers=copy_workers, selection=FileSelection.GIT) as full_dir:
+            modules_dir = full_dir / "plugins" / "modules"
+            assert (modules_dir / "mock_module.py").exists()
+            assert (full_dir / "untracked.txt").exists()
+            assert (full_dir / "tests" / "sanity" / "ignore-2.19.txt").exists()
+            assert not (modules_dir / "__pycache__").exists()
+            assert not (modules_dir / "debug.log").exists()
+            assert not (full_dir / "build").exists()
+            assert not (full_dir / ".git").exists()
+
+
+def test_context_cache(mock_collection, mocker):
+    modules_dir = mock_collection / "plugins" / "modules"
+    with set_dir(modules_dir):
+        context = create_context()
+        assert context.base_dir == mock_collection
+        assert context.read_coll_meta() == ("mock", "coll", "1.2.3")
+
+        mocker.patch.dict("andebox.context._galaxy_meta", clear=True)
+        yaml_load_spy = mocker.spy(andebox.context, "yaml_load")
+        context = create_context()
+        assert context.base_dir == mock_collection
+        assert context.type == ContextType.COLLECTION
+        assert context.read_coll_meta() == ("mock", "coll", "1.2.3")
+        yaml_load_spy.assert_not_called()
+
+        (mock_collection / "galaxy.yml").write_text("namespace: mock\nname: coll\nversion: 1.2.40\n")
+        context = create_context()
+        assert context.read_coll_meta() == ("mock", "coll", "1.2.40")
+        yaml_load_spy.assert_called_once()
+
+        (modules_dir / "meta").mkdir()
+        (modules_dir / "meta" / "runtime.yml").write_text("---\n")
+        (modules_dir / "galaxy.yml").write_text("namespace: inner\nname: coll\nversion: 0.0.1\n")
+        context = create_context()
+        assert context.base_dir == modules_dir
+        assert context.read_coll_meta() == ("inner", "coll", "0.0.1")
+
+
+@pytest.mark.slow
+def test_yaml_load_benchmark():
+    if YamlSafeLoader is yaml.SafeLoader:
+        pytest.skip("PyYAML has been built without libyaml")
+
+    plugin_routing = {
+        plugin_type: {
+            f"{plugin_type}_{n}": {"deprecation": {"removal_version": "12.0.0", "warning_text": f"Use {plugin_type}_{n + 1} instead."}} for n in range(1000)
+        }
+        for plugin_type in ("modules", "lookup", "callback")
+    }
+    content = yaml.safe_dump({"requires_ansible": ">=2.18.0", "plugin_routing": plugin_routing})
+
+    start = time.perf_counter()
+    expected = yaml.load(content, Loader=yaml.SafeLoader)
+    pure_python = time.perf_counter() - start
+
+    start = time.perf_counter()
+    assert yaml_load(content) == expected
+    libyaml = time.perf_counter() - start
+
+    print(f"runtime.yml with {len(content)} bytes: SafeLoader {pure_python:.3f}s, {YamlSafeLoader.__name__} {libyaml:.3f}s")
+    assert libyaml * 2 < pure_python
@@ -0,0 +1,79 @@
+# code: language=python tabSize=4
+#
+# (C) 2026 Alexei Znamensky
+# Licensed under the MIT License. See LICENSES/MIT.txt for details.
+# SPDX-FileCopyrightText: 2026 Alexei Znamensky
+# SPDX-License-Identifier: MIT
+#
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+# Maximum time, in milliseconds, that andebox may add on top of a bare interpreter start.
+# Raise it deliberately (and explain why in the commit) if a change really needs more.
+COLD_START_THRESHOLDS = {
+    "context": 250,
+    "--version": 200,
+}
+RUNS = 5
+
+
+@pytest.fixture
+def collection_dir(make_collection):
+    return make_collection()
+
+
+def _median_ms(cmd, cwd):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, capture_output=True, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("args", COLD_START_THRESHOLDS.keys())
+def test_cold_start(args, collection_dir):
+    cmd = [sys.executable, "-m", "andebox", args]
+    # first run writes the bytecode caches, it is not what users see after installing
+    subprocess.run(cmd, cwd=collection_dir, capture_output=True, check=True)
+
+    baseline = _median_ms([sys.executable, "-c", "pass"], collection_dir)
+    andebox = _median_ms(cmd, collection_dir)
+    overhead = andebox - baseline
+    print(f"andebox {args}: {andebox:.1f} ms, interpreter: {baseline:.1f} ms, overhead: {overhead:.1f} ms")
+    assert overhead < COLD_START_THRESHOLDS[args]
+
+
+@pytest.mark.parametrize(
+    "args,env",
+    [
+        (["--profile-startup", "context"], {}),
+        (["context"], {"ANDEBOX_PROFILE_STARTUP": "1"}),
+    ],
+)
+def test_profile_startup(args, env, collection_dir):
+    result = subprocess.run(
+        [sys.executable, "-m", "andebox"] + args,
+        cwd=collection_dir,
+        capture_output=True,
+        text=True,
+        check=True,
+        env=dict(os.environ, **env),
+    )
+    assert "Collection: mock.coll 1.0.0" in result.stdout
+    assert "andebox startup profile" in result.stderr
+    assert "load action 'context'" in result.stderr
+    assert "context detection" in result.stderr
+    assert "andebox.context" in result.stderr
+
+
+def test_profile_startup_disabled(collection_dir):
+    env = {k: v for k, v in os.environ.items() if k != "ANDEBOX_PROFILE_STARTUP"}
+    result = subprocess.run([sys.executable, "-m", "andebox", "context"], cwd=collection_dir, capture_output=True, text=True, check=True, env=env)
+    assert "andebox startup profile" not in result.stderr